@@ -1,5 +1,13 @@
 from flask import Flask
 from app.db_extension import db
+from app.quotes import quote_cache
+from app.positions import rebuild_positions_command
+from app.sp500_correlation import build_sp500_correlation_command
+from app.sp500 import update_sp500_command
+from app.price_ingest import ingest_prices_command
+from app.price_snapshot import build_price_snapshot_command
+from app.nav import update_nav_command
+from app.dividends import ingest_dividends_command
 from app.models import Todo  # Import the Todo model
 from app.blueprints.auth import auth_bp
 from app.blueprints.correlation import correlation_bp
@@ -10,7 +18,11 @@ from app.blueprints.transactions import transactions_bp
 from app.blueprints.todo import todo_bp
 from app.blueprints.dca import dca_bp
 from app.blueprints.dca_stocks import dca_stocks_bp
-from app.utils import user_is_admin
+from app.current_user import user_cache
+from app.result_cache import correlation_cache
+from app.jobs import job_queue, run_jobs_command
+from app.blueprints.jobs import jobs_bp
+from app.lazy import LazyPrefixDispatcher
 
 __version__ = '0.0.10'
 
@@ -19,6 +31,10 @@ def create_app():
     app.config.from_object('config.Config')
 
     db.init_app(app)
+    quote_cache.init_app(app)
+    user_cache.init_app(app)
+    correlation_cache.init_app(app)
+    job_queue.init_app(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(correlation_bp)
@@ -29,14 +45,22 @@ def create_app():
     app.register_blueprint(todo_bp)
     app.register_blueprint(dca_bp)
     app.register_blueprint(dca_stocks_bp)
-    
-    @app.context_processor
-    def inject_user_is_admin():
-        return dict(user_is_admin=user_is_admin)
+    app.register_blueprint(jobs_bp)
 
-    # Import and initialize the Dash app
-    from app.dash_app import init_dash
-    dash_app = init_dash(app)
+    app.cli.add_command(rebuild_positions_command)
+    app.cli.add_command(build_sp500_correlation_command)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(update_sp500_command)
+    app.cli.add_command(ingest_prices_command)
+    app.cli.add_command(build_price_snapshot_command)
+    app.cli.add_command(update_nav_command)
+    app.cli.add_command(ingest_dividends_command)
+    
+    # The Dash board gets its own server, built and imported on the first /dash/ request
+    def dash_server():
+        from app.dash_app import create_dash_server
+        return create_dash_server(app).wsgi_app
+    app.wsgi_app = LazyPrefixDispatcher(app.wsgi_app, '/dash/', dash_server)
     
     @app.context_processor
     def inject_version():
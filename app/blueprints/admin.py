@@ -1,15 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, request, session, flash, jsonify
-from app.models import User, SP500Ticker
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from app.models import User, Job
 from app.db_extension import db
-import pandas as pd
+from app.quotes import quote_cache
+from app.result_cache import correlation_cache
+from app.jobs import job_queue
+from app.sp500 import refresh_sp500
+from app.current_user import current_user_is_admin, user_cache
 
 admin_bp = Blueprint('admin', __name__)
 
 def is_admin():
-    if 'user' in session:
-        user = User.query.filter_by(username=session['user']).first()
-        return user and user.is_admin == 1
-    return False
+    return current_user_is_admin()
 
 @admin_bp.route('/lock_user/<int:user_id>', methods=['POST'])
 def lock_user(user_id):
@@ -21,6 +22,7 @@ def lock_user(user_id):
     if user:
         user.status = new_status
         db.session.commit()
+        user_cache.invalidate(user_id)
     return redirect(url_for('admin.users_page'))
 
 @admin_bp.route('/toggle_admin/<int:user_id>', methods=['POST'])
@@ -33,6 +35,7 @@ def toggle_admin(user_id):
     if user:
         user.is_admin = new_is_admin
         db.session.commit()
+        user_cache.invalidate(user_id)
     return redirect(url_for('admin.users_page'))
 
 @admin_bp.route('/delete_user/<int:user_id>', methods=['POST'])
@@ -44,6 +47,7 @@ def delete_user(user_id):
     if user:
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user_id)
     return redirect(url_for('admin.users_page'))
 
 @admin_bp.route('/users')
@@ -56,29 +60,32 @@ def users_page():
 
 @admin_bp.route('/update_sp500', methods=['POST'])
 def update_sp500():
+    if not is_admin():
+        return jsonify({'status': 'error', 'message': 'Access denied.'}), 403
     try:
-        # URL of the Wikipedia page containing the list of S&P 500 companies
-        wiki_url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-
-        # Read the table from the Wikipedia page
-        tables = pd.read_html(wiki_url)
-        sp500_table = tables[0]  # The first table contains the S&P 500 companies
-
-        # Extract the ticker symbols and company names
-        tickers = sp500_table[['Symbol', 'Security']]
-
-        # Delete existing data from the table
-        SP500Ticker.query.delete()
+        summary = refresh_sp500()
+        return jsonify({'status': 'success', 'message': 'S&P 500 tickers have been successfully updated.', **summary})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)})
 
-        # Insert the tickers into the database
-        for index, row in tickers.iterrows():
-            new_ticker = SP500Ticker(ticker=row['Symbol'], company_name=row['Security'])
-            db.session.add(new_ticker)
+@admin_bp.route('/quote_cache_stats')
+def quote_cache_stats():
+    if not is_admin():
+        return jsonify({'status': 'error', 'message': 'Access denied.'}), 403
+    return jsonify(quote_cache.stats())
 
-        # Commit the transaction
-        db.session.commit()
+@admin_bp.route('/correlation_cache_stats')
+def correlation_cache_stats():
+    if not is_admin():
+        return jsonify({'status': 'error', 'message': 'Access denied.'}), 403
+    return jsonify(correlation_cache.stats())
 
-        return jsonify({'status': 'success', 'message': 'S&P 500 tickers have been successfully updated.'})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'status': 'error', 'message': str(e)})
\ No newline at end of file
+@admin_bp.route('/job_queue')
+def job_queue_page():
+    if not is_admin():
+        flash('Access denied.')
+        return redirect(url_for('main.home'))
+    job_queue.reap(force=True)
+    jobs = Job.query.with_entities(Job.id, Job.kind, Job.status, Job.user_id, Job.created_at, Job.started_at,
+                                   Job.finished_at, Job.error).order_by(Job.created_at.desc()).limit(50).all()
+    return render_template('admin/jobs.html', stats=job_queue.stats(), jobs=jobs)
@@ -12,10 +12,11 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
         if user and check_password_hash(user.password, password):
-            session['user'] = username
             if user.status == 'locked':
                 flash('Your account is locked.')
                 return redirect(url_for('auth.login'))
+            session['user'] = username
+            session['user_id'] = user.id
             return redirect(url_for('main.home'))
         else:
             flash('Invalid username or password.')
@@ -52,5 +53,6 @@ def register():
 @auth_bp.route('/logout')
 def logout():
     session.pop('user', None)
+    session.pop('user_id', None)
     flash('You have been logged out.')
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -1,27 +1,120 @@
-from flask import Blueprint, render_template, session, request, redirect, url_for
-from app.models import Portfolio, Transaction, User
+from flask import Blueprint, render_template, request, redirect, url_for, g, jsonify, current_app
+from app.models import Portfolio, Transaction
 from app.utils import get_time_delta, calculate_average_correlation
-import yfinance as yf
-import pandas as pd
-import plotly.express as px
-import plotly.io as pio
-import numpy as np
-from datetime import datetime
+from app.price_store import ensure_prices, load_prices, latest_price_date
+from app.result_cache import correlation_cache
+from app.chart_payload import figure_json
+from app.rolling_correlation import RollingCorrelation
+from app.sp500_correlation import CORRELATION_WINDOWS, load_sp500_correlation
+from app.positions import get_positions
+from app.jobs import job_handler, submit_job
+from datetime import date, datetime
+import json
+import time
 from app.db_extension import db 
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 correlation_bp = Blueprint('correlation', __name__)
 
-@correlation_bp.route('/correlation', methods=['GET', 'POST'])
-def correlation():
-    username = session.get('user')  # Get the logged-in user's username
-    if not username:
-        return redirect(url_for('auth.login'))
-    
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        return redirect(url_for('auth.login'))
-    
-    portfolios = Portfolio.query.filter_by(user_id=user.id).all()
+# Periods whose charts are computed by the job queue instead of the request
+LONG_PERIODS = ('5y', '10y')
+
+def traded_tickers_query(portfolio_ids, cutoff_date=None):
+    # The period filter runs in SQL and is served by ix_transaction_portfolio_date
+    query = db.session.query(Transaction.stock_ticker).filter(Transaction.portfolio_id.in_(portfolio_ids))
+    if cutoff_date:
+        query = query.filter(Transaction.date >= cutoff_date.date())
+    return query.distinct()
+
+def build_correlation_charts(engine, portfolio_label, time_period):
+    """Correlation matrix plus heatmap and price history figures as Plotly JSON, or None without enough data."""
+    import plotly.express as px
+    # The engine only holds days with at least one price
+    if len(engine) < 30:
+        return None
+
+    # Tickers without any price in the window are left out, as DataFrame.corr() would
+    observed = engine.observations() > 0
+    close_prices = engine.prices().loc[:, observed]
+
+    # Pearson correlation from the engine's running sums, rounded to 2 decimal places
+    correlation_matrix = engine.matrix().loc[observed, observed].round(2)
+
+    # Set the diagonal values to NaN to reduce self-correlation
+    np.fill_diagonal(correlation_matrix.values, np.nan)
+
+    # Mask the upper triangle of the correlation matrix
+    mask = correlation_matrix.where(np.tril(np.ones(correlation_matrix.shape)).astype(bool))
+
+    # Calculate average correlation index
+    avg_correlation = calculate_average_correlation(correlation_matrix)
+
+    # Generate Plotly heatmap
+    fig_heatmap = px.imshow(mask, text_auto=True, aspect="auto", color_continuous_scale='RdBu_r', zmin=-1, zmax=1)
+    fig_heatmap.update_layout(
+        title=f"Correlation Matrix for {portfolio_label} over {time_period} (Avg Correlation: {avg_correlation:.2f})",
+        template='plotly_white'
+    )
+
+    # Generate Plotly line plot for stock price history
+    fig_line = px.line(close_prices, title="Stock Price History", template='plotly_white')
+    fig_line.update_layout(
+        title=f"Stock Price History for {portfolio_label} over {time_period}",
+        template='plotly_white'
+    )
+
+    return {
+        'engine': engine,
+        'matrix': correlation_matrix,
+        'heatmap': figure_json(fig_heatmap),
+        'line': figure_json(fig_line)
+    }
+
+def cached_correlation_charts(stock_tickers, time_period, cutoff_date, active_positions_only, portfolio_label):
+    # The newest stored bar is the cache version: once prices advance a trading day the old entry is replaced
+    as_of = latest_price_date(stock_tickers)
+    if as_of is None:
+        return None
+    window_start = cutoff_date.date() if cutoff_date else None
+    # The portfolio name is part of the key because it is baked into the chart titles
+    group = (tuple(sorted(stock_tickers)), time_period, active_positions_only, portfolio_label)
+    version = (as_of, window_start)
+    charts = correlation_cache.get(group, version)
+    if charts is None:
+        engine = advance_correlation_engine(correlation_cache.latest(group), as_of, window_start)
+        if engine is None:
+            engine = RollingCorrelation.from_prices(load_prices(group[0], cutoff_date))
+        # Results without enough data are cached too, so they are not reloaded on every view
+        charts = correlation_cache.set(group, version, build_correlation_charts(engine, portfolio_label, time_period)
+                                       or {'engine': engine})
+    return charts if 'matrix' in charts else None
+
+def advance_correlation_engine(previous, as_of, window_start):
+    # Move yesterday's window forward instead of rebuilding it: O(k²) per new day rather than O(k²·T)
+    if previous is None or 'engine' not in previous[1]:
+        return None
+    (previous_as_of, previous_start), charts = previous
+    if as_of < previous_as_of or (window_start or date.min) < (previous_start or date.min):
+        return None
+    # Copy so a concurrent request never sees a half-updated engine
+    engine = charts['engine'].copy()
+    # The last stored day may have been refreshed since, so it is reloaded with the new days
+    engine.pop_since(pd.Timestamp(previous_as_of))
+    engine.extend(load_prices(engine.tickers, previous_as_of, as_of))
+    if window_start:
+        engine.expire(pd.Timestamp(window_start))
+    return engine
+
+def correlation_selection(values, user_id):
+    """Resolve the correlation form values (request.form, request.args or a dict) for a user.
+
+    Returns the user's portfolios, the selected portfolio (None for all of
+    them), the period, its cutoff, the active-positions flag, the open
+    positions and the tickers to correlate. Only DB reads, no price data.
+    """
+    portfolios = Portfolio.query.filter_by(user_id=user_id).all()
     
     # Set default portfolio and time period
     if portfolios:
@@ -30,114 +123,142 @@ def correlation():
         default_portfolio_id = None
     default_time_period = '1y'
     
-    selected_portfolio_id = request.form.get('portfolio_id', default_portfolio_id)
-    selected_time_period = request.form.get('time_period', default_time_period)
-    active_positions_only = request.form.get('active_positions_only') == 'on'
+    # An empty portfolio_id selects all portfolios, an unreadable one the default
+    selected_portfolio_id = values.get('portfolio_id', default_portfolio_id)
+    try:
+        selected_portfolio_id = int(selected_portfolio_id) if selected_portfolio_id else None
+    except ValueError:
+        selected_portfolio_id = default_portfolio_id
+    selected_time_period = values.get('time_period', default_time_period)
+    active_positions_only = values.get('active_positions_only') == 'on'
     
+    # Portfolios of other users are never evaluated
+    portfolios_by_id = {p.id: p for p in portfolios}
+    if selected_portfolio_id and selected_portfolio_id not in portfolios_by_id:
+        selected_portfolio_id = default_portfolio_id
     if selected_portfolio_id:
-        transactions = Transaction.query.filter_by(portfolio_id=selected_portfolio_id).all()
-        selected_portfolio = db.session.get(Portfolio, selected_portfolio_id)
+        portfolio_ids = [selected_portfolio_id]
+        selected_portfolio = portfolios_by_id[selected_portfolio_id]
     else:
-        transactions = Transaction.query.filter(Transaction.portfolio_id.in_([p.id for p in portfolios])).all()
+        portfolio_ids = [p.id for p in portfolios]
         selected_portfolio = None
     
-    # Filter transactions based on the selected time period
+    # Only tickers traded within the selected time period are evaluated
     cutoff_date = None
     if selected_time_period:
         time_delta = get_time_delta(selected_time_period)
         if time_delta:
             cutoff_date = datetime.now() - time_delta
-            transactions = [t for t in transactions if datetime.strptime(t.date, '%Y-%m-%d') >= cutoff_date]
+    traded_tickers = {row.stock_ticker for row in traded_tickers_query(portfolio_ids, cutoff_date)}
     
-    # Calculate active positions
-    positions_dict = {}
-    for transaction in transactions:
-        stock_ticker = transaction.stock_ticker
-        if stock_ticker not in positions_dict:
-            positions_dict[stock_ticker] = [0, 0, 0, transaction.currency]  # [quantity, total_cost, avg_price, currency]
-        if transaction.transaction_type == 'buy':
-            positions_dict[stock_ticker][0] += transaction.stock_quantity
-            positions_dict[stock_ticker][1] += transaction.total_transaction_cost
-        elif transaction.transaction_type == 'sell':
-            positions_dict[stock_ticker][0] -= transaction.stock_quantity
-            positions_dict[stock_ticker][1] -= transaction.total_transaction_cost
-        positions_dict[stock_ticker][2] = round(positions_dict[stock_ticker][1] / positions_dict[stock_ticker][0], 2) if positions_dict[stock_ticker][0] != 0 else 0
+    # Positions come from the ledger maintained on write
+    positions_dict = get_positions(portfolio_ids)
+    for data in positions_dict.values():
+        data[2] = round(data[2], 2)
     # Filter active positions where total cost is not zero
     active_positions = {ticker: data for ticker, data in positions_dict.items() if data[1] != 0}
     
     # Apply filtering based on the checkbox
     if active_positions_only:
-        transactions = [t for t in transactions if t.stock_ticker in active_positions and positions_dict[t.stock_ticker][0] != 0]
+        stock_tickers = [ticker for ticker in traded_tickers if ticker in active_positions and positions_dict[ticker][0] != 0]
     else:
-        transactions = [t for t in transactions if t.stock_ticker in active_positions]
-    
-    # Fetch close price data from yfinance
-    if transactions:
-        stock_tickers = list(set(t.stock_ticker for t in transactions))
-        interval = '1d'
-        if cutoff_date:
-            data = yf.download(stock_tickers, start=cutoff_date.strftime('%Y-%m-%d'), interval=interval)
-        else:
-            data = yf.download(stock_tickers, interval=interval)
-
-        if 'Close' in data:
-            close_prices = data['Close']
-            
-            # Ensure close_prices is a DataFrame
-            if isinstance(close_prices, pd.Series):
-                close_prices = close_prices.to_frame()
-            
-            # Check for missing data and align the data
-            close_prices = close_prices.dropna(how='all')
-            if close_prices.empty:
-                correlation_matrix = None
-                heatmapJSON = None
-                linePlotJSON = None
-            elif len(close_prices) < 30:
-                correlation_matrix = None
-                heatmapJSON = None
-                linePlotJSON = None
-            else:
-                # Calculate correlation using Pearson method and round to 2 decimal places
-                correlation_matrix = close_prices.corr(method='pearson').round(2)
-                
-                # Set the diagonal values to NaN to reduce self-correlation
-                np.fill_diagonal(correlation_matrix.values, np.nan)
-                
-                # Mask the upper triangle of the correlation matrix
-                mask = correlation_matrix.where(np.tril(np.ones(correlation_matrix.shape)).astype(bool))
-                
-                # Calculate average correlation index
-                avg_correlation = calculate_average_correlation(correlation_matrix)
-                
-                # Generate Plotly heatmap
-                fig_heatmap = px.imshow(mask, text_auto=True, aspect="auto", color_continuous_scale='RdBu_r', zmin=-1, zmax=1)
-                fig_heatmap.update_layout(
-                    title=f"Correlation Matrix for {selected_portfolio.name if selected_portfolio else 'All Portfolios'} over {selected_time_period} (Avg Correlation: {avg_correlation:.2f})",
-                    template='plotly_white'
-                )
-                
-                # Convert Plotly heatmap figure to JSON
-                heatmapJSON = pio.to_json(fig_heatmap)
-                
-                # Generate Plotly line plot for stock price history
-                fig_line = px.line(close_prices, title="Stock Price History", template='plotly_white')
-                fig_line.update_layout(
-                    title=f"Stock Price History for {selected_portfolio.name if selected_portfolio else 'All Portfolios'} over {selected_time_period}",
-                    template='plotly_white'
-                )
-                
-                # Convert Plotly line plot figure to JSON
-                linePlotJSON = pio.to_json(fig_line)
-                
-                return render_template('correlation.html', portfolios=portfolios, graphJSON=heatmapJSON, linePlotJSON=linePlotJSON, selected_portfolio=selected_portfolio, selected_time_period=selected_time_period, active_positions=active_positions, active_positions_only=active_positions_only)
-        else:
-            correlation_matrix = None
-            heatmapJSON = None
-            linePlotJSON = None
-    else:
-        correlation_matrix = None
-        heatmapJSON = None
-        linePlotJSON = None
+        stock_tickers = [ticker for ticker in traded_tickers if ticker in active_positions]
+
+    return {
+        'portfolios': portfolios,
+        'selected_portfolio': selected_portfolio,
+        'selected_time_period': selected_time_period,
+        'cutoff_date': cutoff_date,
+        'active_positions_only': active_positions_only,
+        'active_positions': active_positions,
+        'stock_tickers': stock_tickers
+    }
+
+@correlation_bp.route('/correlation', methods=['GET', 'POST'])
+def correlation():
+    # The page shell only needs the DB; the charts are fetched from correlation_charts() after load
+    if not g.current_user:
+        return redirect(url_for('auth.login'))
+
+    selection = correlation_selection(request.form, g.current_user.id)
+    selected_portfolio = selection['selected_portfolio']
+    charts_url = None
+    if selection['stock_tickers']:
+        charts_url = url_for('correlation.correlation_charts',
+                             portfolio_id=selected_portfolio.id if selected_portfolio else '',
+                             time_period=selection['selected_time_period'],
+                             active_positions_only='on' if selection['active_positions_only'] else None)
+
+    return render_template('correlation.html', portfolios=selection['portfolios'], charts_url=charts_url, selected_portfolio=selected_portfolio, selected_time_period=selection['selected_time_period'], active_positions=selection['active_positions'], active_positions_only=selection['active_positions_only'])
+
+def correlation_charts_body(selection):
+    # JSON text for the charts endpoint and the background job
+    charts = None
+    if selection['stock_tickers']:
+        ensure_prices(selection['stock_tickers'], selection['cutoff_date'])
+        selected_portfolio = selection['selected_portfolio']
+        portfolio_label = selected_portfolio.name if selected_portfolio else 'All Portfolios'
+        charts = cached_correlation_charts(selection['stock_tickers'], selection['selected_time_period'],
+                                           selection['cutoff_date'], selection['active_positions_only'],
+                                           portfolio_label)
+
+    if charts is None:
+        return json.dumps({'status': 'empty', 'message': 'Not enough price data to calculate correlation.'})
+    # The cached figures are already JSON, so they are spliced in rather than parsed and dumped again
+    return f'{{"status": "success", "heatmap": {charts["heatmap"]}, "line": {charts["line"]}}}'
+
+@job_handler('correlation_charts')
+def correlation_charts_job(user_id, values):
+    return correlation_charts_body(correlation_selection(values, user_id))
+
+@correlation_bp.route('/correlation/charts')
+def correlation_charts():
+    """Heatmap and price history figures for the correlation page as one JSON document.
+
+    Long periods are handed to the job queue: the response is then 202 with
+    a job id to poll at /jobs/<id>.
+    """
+    if not g.current_user:
+        return jsonify({'status': 'error', 'message': 'Login required.'}), 401
+
+    values = {key: request.args[key] for key in ('time_period', 'active_positions_only') if key in request.args}
+    if 'portfolio_id' in request.args:
+        # None (all portfolios) for an empty or non-numeric id
+        values['portfolio_id'] = request.args.get('portfolio_id', type=int)
+    if values.get('time_period') in LONG_PERIODS:
+        job = submit_job('correlation_charts', {'user_id': g.current_user.id, 'values': values}, user_id=g.current_user.id)
+        return jsonify({'status': 'queued', 'job_id': job.id, 'poll_url': url_for('jobs.job_status', job_id=job.id)}), 202
+
+    started = time.perf_counter()
+    body = correlation_charts_body(correlation_selection(values, g.current_user.id))
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['Server-Timing'] = f'charts;dur={(time.perf_counter() - started) * 1000:.1f}'
+    return response
+
+@correlation_bp.route('/correlation/sp500')
+def sp500_correlation():
+    """Daily-return correlation of the S&P 500 constituents from the nightly snapshot, optionally for a ticker subset."""
+    if not g.current_user:
+        return jsonify({'status': 'error', 'message': 'Login required.'}), 401
+
+    period = request.args.get('period', '1y')
+    if period not in CORRELATION_WINDOWS:
+        return jsonify({'status': 'error', 'message': f'Unknown period: {period}'}), 400
+    tickers = request.args.get('tickers')
+    if tickers:
+        tickers = [ticker.strip().upper() for ticker in tickers.split(',') if ticker.strip()]
+
+    result = load_sp500_correlation(period, tickers or None)
+    if result is None:
+        return jsonify({'status': 'error', 'message': 'The S&P 500 correlation snapshot has not been built yet.'}), 503
+    tickers, matrix, index = result
 
-    return render_template('correlation.html', portfolios=portfolios, graphJSON=heatmapJSON, linePlotJSON=linePlotJSON, selected_portfolio=selected_portfolio, selected_time_period=selected_time_period, active_positions=active_positions, active_positions_only=active_positions_only)
\ No newline at end of file
+    values = np.round(matrix.astype(float), 4)
+    return jsonify({
+        'status': 'success',
+        'period': period,
+        'as_of': index['as_of'],
+        'days': index['days'][period],
+        'tickers': tickers,
+        'matrix': np.where(np.isnan(values), None, values).tolist()
+    })
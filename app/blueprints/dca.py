@@ -1,12 +1,24 @@
-from flask import Blueprint, render_template, request, send_file, flash
-import plotly.graph_objs as go
-import plotly.io as pio
-from plotly.subplots import make_subplots
-import pandas as pd
+from flask import Blueprint, render_template, request, send_file, flash, jsonify, current_app
+from app.chart_payload import figure_json
 import io
+from concurrent.futures.process import BrokenProcessPool
+from app.dca_engine import calculate_dca_batch, scenario_grid, run_monte_carlo_dca
+from app.price_store import get_prices
+from app.lazy import lazy_import
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
 
 dca_bp = Blueprint('dca', __name__)
 
+# Upper bound for one /dca/batch request
+MAX_SCENARIOS = 100000
+
+MONTE_CARLO_DISTRIBUTIONS = ['normal', 'student_t', 'bootstrap']
+MAX_MONTE_CARLO_PATHS = 1000000
+MAX_MONTE_CARLO_YEARS = 60
+# Index whose history feeds the bootstrap distribution
+BOOTSTRAP_INDEX = '^GSPC'
+
 @dca_bp.route('/dca', methods=['GET', 'POST'])
 def dca_calculator():
     frequency_map = {
@@ -27,6 +39,9 @@ def dca_calculator():
             flash("All input fields are required and must be valid numbers.")
             return render_template('dca.html', frequency_map=frequency_map)
 
+        if 'monte_carlo' in request.form:
+            return monte_carlo(initial_investment, monthly_investment, annual_return, years, contribution_frequency, frequency_map)
+
         total_investment, final_amount, values, contributions, profit_percentages = calculate_dca(
             initial_investment, monthly_investment, annual_return, years, contribution_frequency
         )
@@ -63,6 +78,94 @@ def dca_calculator():
                                monthly_investment=monthly_investment, annual_return=annual_return, years=years)
     return render_template('dca.html', frequency_map=frequency_map)
 
+def monte_carlo(initial_investment, monthly_investment, annual_return, years, contribution_frequency, frequency_map):
+    form_values = dict(frequency_map=frequency_map, contribution_frequency=contribution_frequency,
+                       initial_investment=initial_investment, monthly_investment=monthly_investment,
+                       annual_return=annual_return, years=years, monte_carlo=True)
+    try:
+        volatility = float(request.form.get('volatility', 15))
+        paths = int(request.form.get('paths', 100000))
+        distribution = request.form.get('distribution', 'normal')
+        if (distribution not in MONTE_CARLO_DISTRIBUTIONS or not 1 <= paths <= MAX_MONTE_CARLO_PATHS
+                or not 1 <= years <= MAX_MONTE_CARLO_YEARS):
+            raise ValueError
+    except ValueError:
+        flash(f"Monte Carlo needs a valid volatility, a distribution, between 1 and {MAX_MONTE_CARLO_PATHS} paths "
+              f"and between 1 and {MAX_MONTE_CARLO_YEARS} years.")
+        return render_template('dca.html', **form_values)
+    form_values.update(volatility=volatility, paths=paths, distribution=distribution)
+
+    historical_returns = None
+    if distribution == 'bootstrap':
+        historical_returns = historical_monthly_returns(BOOTSTRAP_INDEX)
+
+    try:
+        result = run_monte_carlo_dca(initial_investment, monthly_investment, years, contribution_frequency,
+                                     paths=paths, distribution=distribution, annual_return=annual_return,
+                                     volatility=volatility, historical_returns=historical_returns,
+                                     max_workers=current_app.config.get('MONTE_CARLO_WORKERS'))
+    except ValueError as e:
+        flash(f"Monte Carlo simulation failed: {e}")
+        return render_template('dca.html', **form_values)
+    except BrokenProcessPool:
+        flash("Monte Carlo simulation failed: a simulation worker stopped unexpectedly. Please try again.")
+        return render_template('dca.html', **form_values)
+
+    plot_json = generate_monte_carlo_plot(result)
+    bands = {p: round(float(band[-1]), 2) for p, band in result['bands'].items()}
+    return render_template('dca.html', total_investment=result['total_investment'], final_amount=bands[50],
+                           final_bands=bands, probability_of_loss=round(result['probability_of_loss'] * 100, 2),
+                           approximate_bands=result['approximate_bands'],
+                           plot_json=plot_json, **form_values)
+
+def historical_monthly_returns(ticker):
+    prices = get_prices([ticker], None, field='adj_close')
+    if ticker not in prices:
+        return None
+    monthly_prices = prices[ticker].dropna().resample('ME').last()
+    return monthly_prices.pct_change().dropna().to_numpy()
+
+@dca_bp.route('/dca/batch', methods=['POST'])
+def dca_batch():
+    # Scenario sweep: every combination of the posted parameter lists is evaluated at once
+    params = request.get_json(silent=True) or {}
+    try:
+        initial_investment = float(params.get('initial_investment', 0))
+        series_step = int(params.get('series_step', 12))
+        annual_returns, years, frequencies, monthly_investments = scenario_grid(
+            params['annual_returns'], params['years'],
+            params.get('contribution_frequencies', ['monthly']), params['monthly_investments'])
+        if len(annual_returns) > MAX_SCENARIOS:
+            return jsonify({'status': 'error', 'message': f'At most {MAX_SCENARIOS} scenarios per request.'}), 400
+        if series_step < 1 or (years < 0).any():
+            raise ValueError('series_step must be positive and years must not be negative.')
+        result = calculate_dca_batch(initial_investment, monthly_investments, annual_returns, years, frequencies, series_step)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid scenario parameters: {e}'}), 400
+
+    values = np.round(result['values'], 2)
+    final_amounts = result['final_amount']
+    scenarios = [
+        {
+            'annual_return': float(annual_returns[i]),
+            'years': int(years[i]),
+            'contribution_frequency': frequencies[i],
+            'monthly_investment': float(monthly_investments[i]),
+            'total_investment': round(float(result['total_investment'][i]), 2),
+            'final_amount': round(float(final_amounts[i]), 2),
+            'profit_percentage': round(float(result['profit_percentage'][i]), 2),
+            'values': values[i][~np.isnan(values[i])].tolist()
+        }
+        for i in range(len(annual_returns))
+    ]
+    summary = {
+        'count': len(scenarios),
+        'min_final_amount': round(float(final_amounts.min()), 2) if len(scenarios) else None,
+        'median_final_amount': round(float(np.median(final_amounts)), 2) if len(scenarios) else None,
+        'max_final_amount': round(float(final_amounts.max()), 2) if len(scenarios) else None
+    }
+    return jsonify({'status': 'success', 'months': result['months'].tolist(), 'scenarios': scenarios, 'summary': summary})
+
 def calculate_dca(initial_investment, monthly_investment, annual_return, years, contribution_frequency):
     monthly_return = (1 + annual_return / 100) ** (1 / 12) - 1
     total_investment = initial_investment
@@ -94,6 +197,8 @@ def calculate_dca(initial_investment, monthly_investment, annual_return, years,
     return total_investment, final_amount, values, contributions, profit_percentages
 
 def generate_plot(values, contributions, profit_percentages):
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
     weeks = list(range(len(values)))
     
     # Create a subplot layout with 2 rows
@@ -159,5 +264,42 @@ def generate_plot(values, contributions, profit_percentages):
         height=800   # Set the height of the plot
     )
     
-    plot_json = pio.to_json(fig)
-    return plot_json
\ No newline at end of file
+    plot_json = figure_json(fig)
+    return plot_json
+
+def generate_monte_carlo_plot(result):
+    import plotly.graph_objs as go
+    months = result['months'].tolist()
+    bands = result['bands']
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=months, y=bands[95], mode='lines', name='95th Percentile', line=dict(width=0.5),
+        hovertemplate='Month: %{x}<br>95th Percentile: $%{y:.0f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=months, y=bands[5], mode='lines', name='5th Percentile', line=dict(width=0.5),
+        fill='tonexty', fillcolor='rgba(99, 110, 250, 0.2)',
+        hovertemplate='Month: %{x}<br>5th Percentile: $%{y:.0f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=months, y=bands[50], mode='lines', name='Median',
+        hovertemplate='Month: %{x}<br>Median: $%{y:.0f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=months, y=result['contributions'], mode='lines', name='Contributions',
+        hovertemplate='Month: %{x}<br>Contributions: $%{y:.0f}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title='Monte Carlo DCA Portfolio Value (5th-95th Percentile)',
+        template='plotly_white',
+        hovermode='x',
+        xaxis=dict(title='Month'),
+        yaxis=dict(title='Value ($)'),
+        width=1000,
+        height=600
+    )
+
+    plot_json = figure_json(fig)
+    return plot_json
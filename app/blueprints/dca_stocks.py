@@ -1,14 +1,25 @@
-from flask import Blueprint, render_template, request, flash, send_file, redirect, url_for, json, make_response
-import yfinance as yf
-import pandas as pd
-import plotly.graph_objs as go
-import plotly.io as pio
-from plotly.subplots import make_subplots
+from flask import Blueprint, render_template, request, flash, send_file, redirect, url_for, json, Response, stream_with_context
+from app.price_store import get_prices
+from app.dca_engine import run_dca, parse_weights
+from app.models import Job
+from app.sp500 import sp500_symbols
+from app.db_extension import db
+from app.jobs import FINISHED_STATUSES, job_handler, submit_job
+from werkzeug.datastructures import MultiDict
+from app.chart_payload import figure_json
+import csv
 import io
-import ast
+import tempfile
+from app.lazy import lazy_import
+pd = lazy_import('pandas')
 
 dca_stocks_bp = Blueprint('dca_stocks', __name__)
 
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Large enough for an equal-weight DCA over the whole S&P 500
+MAX_STOCKS = 550
+
 @dca_stocks_bp.route('/dca_stocks', methods=['GET', 'POST'])
 def dca_stocks():
     if request.method == 'POST':
@@ -18,127 +29,150 @@ def dca_stocks():
             stocks = request.form.getlist('stocks')
             investment_amount = float(request.form['investment_amount'])
             frequency = request.form['frequency']
+            weights = request.form.get('weights', '')
+            parse_weights(weights)
         except (ValueError, KeyError):
             flash("All input fields are required and must be valid.")
             return render_template('dca_stocks.html')
 
-        if not stocks or len(stocks) < 1 or len(stocks) > 12:
-            flash("Please select between 1 and 12 stocks.")
-            return render_template('dca_stocks.html')
+        use_sp500 = request.form.get('use_sp500') == 'on'
+        selected_stocks = sp500_symbols() if use_sp500 else stocks
 
-        try:
-            total_investment, final_amount, values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates = calculate_dca_stocks(
-                start_date, end_date, stocks, investment_amount, frequency
-            )
-        except Exception as e:
-            flash(f"Error fetching stock data: {e}")
+        if not selected_stocks or len(selected_stocks) < 1 or len(selected_stocks) > MAX_STOCKS:
+            flash(f"Please select between 1 and {MAX_STOCKS} stocks.")
             return render_template('dca_stocks.html')
 
-        plot_json = generate_plot(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
-
-        return render_template('dca_stocks.html', total_investment=total_investment, final_amount=final_amount, 
-                               plot_json=plot_json, start_date=start_date, end_date=end_date, 
-                               stocks=stocks, investment_amount=investment_amount, frequency=frequency,
-                               weeks=list(range(len(values))), contribution_dates=contribution_dates,
-                               values=values, contributions=contributions, profit_percentages=profit_percentages,
-                               purchased_stocks=purchased_stocks, total_stocks_owned=total_stocks_owned,
-                               stock_prices_list=stock_prices_list)
+        # The simulation runs in the job queue; the result page waits for it
+        job = submit_job('dca_stocks', {
+            'start_date': start_date,
+            'end_date': end_date,
+            'stocks': [] if use_sp500 else stocks,
+            'investment_amount': investment_amount,
+            'frequency': frequency,
+            'weights': weights,
+            'use_sp500': use_sp500
+        })
+        return redirect(url_for('dca_stocks.dca_stocks_result', job_id=job.id))
     return render_template('dca_stocks.html')
 
-@dca_stocks_bp.route('/export_table', methods=['POST'])
-def export_table():
-    if request.method == 'POST':
-        try:
-            start_date = request.form['start_date']
-            end_date = request.form['end_date']
-            stocks = request.form.getlist('stocks')
-            investment_amount = float(request.form['investment_amount'])
-            frequency = request.form['frequency']
-        except (ValueError, KeyError):
-            flash("All input fields are required and must be valid.")
-            return redirect(url_for('dca_stocks.dca_stocks'))
+@job_handler('dca_stocks')
+def dca_stocks_job(start_date, end_date, stocks, investment_amount, frequency, weights, use_sp500):
+    if use_sp500:
+        stocks = sp500_symbols()
+    total_investment, final_amount, values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates = calculate_dca_stocks(
+        start_date, end_date, stocks, investment_amount, frequency, parse_weights(weights)
+    )
+    plot_json = generate_plot(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
+    return dict(total_investment=total_investment, final_amount=final_amount, plot_json=plot_json, stocks=stocks,
+                weeks=list(range(len(values))), contribution_dates=contribution_dates,
+                values=values, contributions=contributions, profit_percentages=profit_percentages,
+                purchased_stocks=purchased_stocks, total_stocks_owned=total_stocks_owned,
+                stock_prices_list=stock_prices_list)
 
-        try:
-            total_investment, final_amount, values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates = calculate_dca_stocks(
-                start_date, end_date, stocks, investment_amount, frequency
-            )
-        except Exception as e:
-            flash(f"Error fetching stock data: {e}")
-            return redirect(url_for('dca_stocks.dca_stocks'))
+def job_form(params):
+    # Rebuild the submitted form so the result page shows the same inputs
+    form = MultiDict([(key, params[key]) for key in ('start_date', 'end_date', 'investment_amount', 'frequency', 'weights')])
+    for stock in params['stocks']:
+        form.add('stocks', stock)
+    if params['use_sp500']:
+        form.add('use_sp500', 'on')
+    return form
+
+@dca_stocks_bp.route('/dca_stocks/jobs/<job_id>')
+def dca_stocks_result(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.kind != 'dca_stocks':
+        flash("This calculation has expired, please run it again.")
+        return redirect(url_for('dca_stocks.dca_stocks'))
 
-        _, _, df = generate_table_data(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
+    form = job_form(json.loads(job.params))
+    if job.status == 'done':
+        return render_template('dca_stocks.html', form=form, job_id=job.id, **json.loads(job.result))
+    if job.status in FINISHED_STATUSES:
+        flash(f"Error fetching stock data: {job.error}")
+        return render_template('dca_stocks.html', form=form)
+    return render_template('dca_stocks.html', form=form, job_poll_url=url_for('jobs.job_status', job_id=job.id))
 
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='DCA Data')
-            writer.save()
-        output.seek(0)
+@dca_stocks_bp.route('/dca_stocks/jobs/<job_id>/export')
+def export_table(job_id):
+    """Download the table of a finished run as CSV (streamed) or XLSX, read from the stored result."""
+    export_format = request.args.get('format', 'xlsx')
+    job = db.session.get(Job, job_id)
+    if export_format not in EXPORT_FORMATS or job is None or job.kind != 'dca_stocks' or job.status != 'done':
+        flash("This calculation has expired, please run it again.")
+        return redirect(url_for('dca_stocks.dca_stocks'))
 
-    return send_file(output, attachment_filename='dca_data.xlsx', as_attachment=True)
+    result = json.loads(job.result)
+    table_header, table_cells = generate_table_data(
+        result['values'], result['contributions'], result['profit_percentages'], result['purchased_stocks'],
+        result['total_stocks_owned'], result['stock_prices_list'], result['contribution_dates'])
+    rows = zip(*table_cells)
 
-def calculate_dca_stocks(start_date, end_date, stocks, investment_amount, frequency):
+    if export_format == 'csv':
+        response = Response(stream_with_context(stream_csv(table_header, rows)), mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename=dca_data.csv'
+        return response
+    return send_file(write_xlsx(table_header, rows), as_attachment=True, download_name='dca_data.xlsx',
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+def stream_csv(header, rows, chunk_size=64 * 1024):
+    # Yield the CSV in chunks so the whole file is never held as one string
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def write_xlsx(header, rows):
+    import xlsxwriter
+    # constant_memory flushes every finished row, so memory does not grow with the table
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('DCA Data')
+    worksheet.write_row(0, 0, header)
+    for row_number, row in enumerate(rows, start=1):
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
+    output.seek(0)
+    return output
+
+def calculate_dca_stocks(start_date, end_date, stocks, investment_amount, frequency, weights=None):
     frequency_map = {
         'monthly': 1,
         'quarterly': 3
-
     }
-    interval_map = {
-        'monthly': '1mo',
-        'quarterly': '3mo'
-    }
-    interval = interval_map[frequency]
-    # periods_per_interval = frequency_map[frequency] // 3 if frequency in ['semiannually', 'annually'] else 1
-    
-    total_investment = 0
-    portfolio = {stock: 0 for stock in stocks}
-    values = []
-    contributions = []
-    profit_percentages = []
-    purchased_stocks = {stock: [] for stock in stocks}
-    total_stocks_owned = {stock: [] for stock in stocks}
-    stock_prices_list = {stock: [] for stock in stocks}
-    contribution_dates = []
-
-    current_date = pd.to_datetime(start_date)
+    months_per_period = frequency_map[frequency]
+
+    start_date = pd.to_datetime(start_date)
     end_date = pd.to_datetime(end_date)
 
-    while current_date < end_date:
-        next_date = current_date + pd.DateOffset(months=3)
-        if next_date > end_date:
-            next_date = end_date
-        
-        stock_data = yf.download(stocks, start=current_date, end=next_date, interval=interval)
-        stock_prices = stock_data['Adj Close']
-        
-        # Interpolate missing data
-        stock_prices = stock_prices.interpolate(method='linear', limit_direction='forward', axis=0)
-        
-        for date, prices in stock_prices.iterrows():
-            if prices.isnull().any():
-                continue  # Skip dates with missing data after interpolation
-            
-            total_investment += investment_amount
-            investment_per_stock = investment_amount / len(stocks)
-            
-            for stock in stocks:
-                shares_purchased = investment_per_stock / prices[stock]
-                portfolio[stock] += shares_purchased
-                purchased_stocks[stock].append(round(shares_purchased, 4))
-                total_stocks_owned[stock].append(round(portfolio[stock], 4))
-                stock_prices_list[stock].append(round(prices[stock], 2))
-            
-            total_value = sum(portfolio[stock] * prices[stock] for stock in stocks)
-            values.append(total_value)
-            contributions.append(total_investment)
-            profit_percentage = ((total_value - total_investment) / total_investment) * 100
-            profit_percentages.append(round(profit_percentage, 2))
-            contribution_dates.append(date.strftime('%Y-%m-%d'))
-        
-        current_date = next_date
-
-    return total_investment, total_value, values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates
+    # Load the whole range once from the local price store into a dense (period x stock) matrix
+    daily_prices = get_prices(stocks, start_date, end_date, field='adj_close').reindex(columns=stocks)
+    stock_prices = resample_contribution_prices(daily_prices, start_date, end_date, months_per_period)
+    
+    # Interpolate missing data
+    stock_prices = stock_prices.interpolate(method='linear', limit_direction='forward', axis=0)
+
+    return run_dca(stock_prices, investment_amount, weights)
+
+def resample_contribution_prices(daily_prices, start_date, end_date, months_per_period):
+    # One price per contribution period: the last close inside [period start, next period start)
+    period_starts = pd.date_range(start_date, end_date, freq=pd.DateOffset(months=months_per_period))
+    period_starts = period_starts[period_starts < end_date]
+    if daily_prices.empty or period_starts.empty:
+        return pd.DataFrame(columns=daily_prices.columns, dtype=float)
+    daily_prices = daily_prices[(daily_prices.index >= start_date) & (daily_prices.index < end_date)]
+    periods = period_starts[period_starts.searchsorted(daily_prices.index, side='right') - 1]
+    return daily_prices.groupby(periods).last()
 
 def generate_plot(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates):
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
     weeks = list(range(len(values)))
     
     # Create a subplot layout with 2 rows
@@ -166,25 +200,7 @@ def generate_plot(values, contributions, profit_percentages, purchased_stocks, t
     ), row=1, col=1, secondary_y=True)
     
     # Prepare data for the table
-    table_header, table_cells, _ = generate_table_data(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
-    
-    df = pd.DataFrame(table_header)
-    # print(df)
-    df2 = pd.DataFrame(table_cells)
-    # print(df2.head())
-    combined_df = pd.concat([df.T, df2.T], ignore_index=True)
-    
-    # Save the DataFrame to a CSV file
-    combined_df.to_excel('./dca_data.xlsx', index=False, sheet_name='DCA Data')
-    
-    # print(combined_df.head())
-  
-    
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        combined_df.to_excel(writer, index=False, sheet_name='DCA Data')
-        # writer.close()
-    output.seek(0)
+    table_header, table_cells = generate_table_data(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
      
     # Add the table to the second row
     fig.add_trace(go.Table(
@@ -225,7 +241,7 @@ def generate_plot(values, contributions, profit_percentages, purchased_stocks, t
         height=800   # Set the height of the plot
     )
     
-    plot_json = pio.to_json(fig)
+    plot_json = figure_json(fig)
     return plot_json
 
 def generate_table_data(values, contributions, profit_percentages, purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates):
@@ -242,8 +258,4 @@ def generate_table_data(values, contributions, profit_percentages, purchased_sto
         table_header.append(f'{stock} Price')
         table_cells.append(stock_prices_list[stock])
     
-    # Create a DataFrame from the table header and table cells
-    data = {header: cells for header, cells in zip(table_header, table_cells)}
-    df = pd.DataFrame(data)
-    
-    return table_header, table_cells, df
\ No newline at end of file
+    return table_header, table_cells
\ No newline at end of file
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, g, current_app
+import json
+from app.models import Job
+from app.db_extension import db
+from app.jobs import FINISHED_STATUSES, job_queue
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def job_response(job):
+    body = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+    text = json.dumps(body)
+    if job.status == 'done' and job.result is not None:
+        # Results are stored as JSON text and spliced in as they are
+        text = f'{text[:-1]}, "result": {job.result}}}'
+    return current_app.response_class(text, mimetype='application/json')
+
+@jobs_bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status and, once done, result of a background job; answers at once, clients poll every second or two."""
+    job_queue.reap()
+    job = db.session.get(Job, job_id)
+    user_id = g.current_user.id if g.current_user else None
+    if job is None or (job.user_id is not None and job.user_id != user_id):
+        return jsonify({'status': 'error', 'message': 'Job not found.'}), 404
+    if job.status not in FINISHED_STATUSES:
+        # Queued jobs left over from a restart need a worker in this process too
+        job_queue.notify()
+    return job_response(job)
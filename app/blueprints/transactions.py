@@ -1,23 +1,65 @@
-from flask import Blueprint, render_template, session, request, redirect, url_for, flash
-from app.models import Portfolio, Transaction, User
-import yfinance as yf
+from flask import Blueprint, render_template, request, redirect, url_for, flash, g
+from app.models import Portfolio, Transaction
+from app.quotes import quote_cache
+from app.positions import apply_transaction, get_positions
+from app.lots import MATCHING_METHODS, match_lots, trades_from_transactions
+from app.fx import convert, reporting_currencies
+from app.nav import PERFORMANCE_PERIODS, period_performance, update_nav
+from app.dividends import dividend_income
+from app.tax import TIME_TEST_YEARS, tax_free_quantities, tax_lot_indexes, tax_report as build_tax_report
 from app.db_extension import db 
+from datetime import date, datetime
+from app.lazy import lazy_import
+np = lazy_import('numpy')
 
 transactions_bp = Blueprint('transactions', __name__)
 
+def reporting_values(positions, realized_lots, transactions, to_currency):
+    """Position, realized profit and transaction amounts in `to_currency`, with totals.
+
+    Open positions are valued at today's rate, realized profits at the rate
+    of the sell date and transactions at the rate of their trade date; all
+    of them are converted together in one convert() call.
+    """
+    today = date.today()
+    open_positions = [position for position in positions if position[1] != 0]
+    groups = [
+        [(position[2], position[6], today) for position in open_positions],
+        [(np.nan if position[5] is None else position[5], position[6], today) for position in open_positions],
+        [(lot.profit, lot.currency, lot.sell_date) for lot in realized_lots],
+        [(t.total_transaction_cost, t.currency, t.date) for t in transactions]
+    ]
+    rows = [row for group in groups for row in group]
+    if not rows:
+        return {'total_cost': {}, 'unrealized': {}, 'realized': [], 'transactions': {},
+                'totals': {'total_cost': 0.0, 'unrealized': 0.0, 'realized': 0.0}}
+    amounts, currencies, dates = zip(*rows)
+    converted = convert(amounts, currencies, dates, to_currency)
+    costs, unrealized, realized, transaction_totals = np.split(converted, np.cumsum([len(group) for group in groups])[:-1])
+
+    return {
+        'total_cost': {position[0]: cost for position, cost in zip(open_positions, costs)},
+        'unrealized': {position[0]: None if np.isnan(value) else value for position, value in zip(open_positions, unrealized)},
+        'realized': list(realized),
+        'transactions': {t.id: value for t, value in zip(transactions, transaction_totals)},
+        'totals': {
+            'total_cost': float(costs.sum()),
+            'unrealized': float(np.nansum(unrealized)),
+            'realized': float(realized.sum())
+        }
+    }
+
 @transactions_bp.route('/transactions', methods=['GET', 'POST'])
 def transactions():
-    if 'user' not in session:
+    if not g.current_user:
         flash('You need to be logged in to view this page.')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
     
-    username = session['user']
-    user = User.query.filter_by(username=username).first()
-    user_id = user.id
+    user_id = g.current_user.id
     
     if request.method == 'POST':
-        portfolio_id = request.form['portfolio_id']
-        date = request.form['date']
+        portfolio_id = int(request.form['portfolio_id'])
+        date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
         stock_ticker = request.form['stock_ticker']
         stock_price = float(request.form['stock_price'])
         transaction_type = request.form['transaction_type']
@@ -41,46 +83,34 @@ def transactions():
         )
         
         db.session.add(new_transaction)
+        apply_transaction(new_transaction)
         db.session.commit()
         
         flash('Transaction added successfully.')
-        return redirect(url_for('transactions'))
+        return redirect(url_for('transactions.transactions'))
     
     portfolios = Portfolio.query.filter_by(user_id=user_id).all()
     selected_portfolio_ids = request.args.getlist('portfolio_id')
     if 'all' in selected_portfolio_ids or not selected_portfolio_ids:
         transactions = Transaction.query.filter_by(user_id=user_id).all()
+        position_portfolio_ids = [p.id for p in portfolios]
     else:
         transactions = Transaction.query.filter(Transaction.portfolio_id.in_(selected_portfolio_ids), Transaction.user_id == user_id).all()
+        position_portfolio_ids = [p.id for p in portfolios if str(p.id) in selected_portfolio_ids]
+
+    # Positions come from the ledger maintained on write
+    positions_dict = get_positions(position_portfolio_ids)
 
-    # Fetch current prices using yfinance
-    current_prices = {}
+    # Fetch current prices for all tickers in one batched, cached lookup
     positions = []
-    for transaction in transactions:
-        stock_ticker = transaction.stock_ticker
-        if stock_ticker not in current_prices:
-            stock_info = yf.Ticker(stock_ticker)
-            try:
-                current_price = stock_info.history(period='1d')['Close'].iloc[0]
-                current_prices[stock_ticker] = current_price
-            except Exception as e:
-                current_prices[stock_ticker] = None
-                flash(f'Error fetching current price for {stock_ticker}: {e}')
-
-    # Calculate positions and unrealized profits
-    positions_dict = {}
-    for transaction in transactions:
-        stock_ticker = transaction.stock_ticker
-        if stock_ticker not in positions_dict:
-            positions_dict[stock_ticker] = [0, 0, 0, transaction.currency]  # [quantity, total_cost, avg_price, currency]
-        if transaction.transaction_type == 'buy':
-            positions_dict[stock_ticker][0] += transaction.stock_quantity
-            positions_dict[stock_ticker][1] += transaction.total_transaction_cost
-        elif transaction.transaction_type == 'sell':
-            positions_dict[stock_ticker][0] -= transaction.stock_quantity
-            positions_dict[stock_ticker][1] -= transaction.total_transaction_cost
-        positions_dict[stock_ticker][2] = positions_dict[stock_ticker][1] / positions_dict[stock_ticker][0] if positions_dict[stock_ticker][0] != 0 else 0
+    quotes = quote_cache.get_quotes([stock_ticker for stock_ticker, values in positions_dict.items() if values[0] != 0])
+    current_prices = {stock_ticker: quote.price for stock_ticker, quote in quotes.items()}
+    stale_prices = {stock_ticker: quote.fetched_at for stock_ticker, quote in quotes.items() if quote.stale}
+    for stock_ticker, current_price in current_prices.items():
+        if current_price is None:
+            flash(f'Error fetching current price for {stock_ticker}')
 
+    # Calculate unrealized profits
     unrealized_profits = {}
     for stock_ticker, values in positions_dict.items():
         quantity, total_cost, avg_price, currency = values
@@ -89,47 +119,39 @@ def transactions():
         positions.append((stock_ticker, quantity, total_cost, avg_price, current_price, unrealized_profit, currency))
         unrealized_profits[stock_ticker] = unrealized_profit
 
-    # Calculate realized profits
-    realized_profits = []
-    for stock_ticker in set([t.stock_ticker for t in transactions]):
-        buys = [t for t in transactions if t.stock_ticker == stock_ticker and t.transaction_type == 'buy']
-        sells = [t for t in transactions if t.stock_ticker == stock_ticker and t.transaction_type == 'sell']
-        
-        buy_index = 0
-        sell_index = 0
-        while buy_index < len(buys) and sell_index < len(sells):
-            buy = buys[buy_index]
-            sell = sells[sell_index]
-            
-            quantity = min(buy.stock_quantity, sell.stock_quantity)
-            profit = (sell.stock_price - buy.stock_price) * quantity - sell.transaction_cost - buy.transaction_cost
-            
-            realized_profits.append((stock_ticker, quantity, profit, buy.currency))
-            
-            buys[buy_index].stock_quantity -= quantity
-            sells[sell_index].stock_quantity -= quantity
-            
-            if buys[buy_index].stock_quantity == 0:
-                buy_index += 1
-            if sells[sell_index].stock_quantity == 0:
-                sell_index += 1
-
-    return render_template('transactions.html', portfolios=portfolios, transactions=transactions, selected_portfolio_ids=selected_portfolio_ids, positions=positions, realized_profits=realized_profits, current_prices=current_prices, unrealized_profits=unrealized_profits)
+    # Open quantity that already passed the Czech time test, per ticker
+    tax_free = tax_free_quantities(tax_lot_indexes(position_portfolio_ids)) if position_portfolio_ids else {}
+
+    # Calculate realized profits by matching sells against earlier buys
+    pnl_method = request.args.get('pnl_method', 'fifo')
+    if pnl_method not in MATCHING_METHODS:
+        pnl_method = 'fifo'
+    realized_lots, _ = match_lots(trades_from_transactions(transactions), pnl_method)
+    realized_profits = [(lot.stock_ticker, lot.quantity, lot.profit, lot.currency) for lot in realized_lots]
+
+    # Optional totals in one reporting currency at the rate as of each date
+    reporting_currency = request.args.get('reporting_currency', '')
+    if reporting_currency not in reporting_currencies():
+        reporting_currency = ''
+    reported = None
+    if reporting_currency:
+        try:
+            reported = reporting_values(positions, realized_lots, transactions, reporting_currency)
+        except ValueError as e:
+            flash(str(e))
+            reporting_currency = ''
+
+    return render_template('transactions.html', portfolios=portfolios, transactions=transactions, selected_portfolio_ids=selected_portfolio_ids, pnl_method=pnl_method, positions=positions, realized_profits=realized_profits, current_prices=current_prices, stale_prices=stale_prices, unrealized_profits=unrealized_profits, tax_free=tax_free, reporting_currencies=reporting_currencies(), reporting_currency=reporting_currency, reported=reported)
 
 
 @transactions_bp.route('/add_transaction', methods=['POST'])
 def add_transaction():
-    if 'user' not in session:
+    if not g.current_user:
         flash('You need to be logged in to add a transaction.')
-        return redirect(url_for('login'))
-    
-    user = User.query.filter_by(username=session['user']).first()
-    if not user:
-        flash('User not found.')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
     
-    portfolio_id = request.form['portfolio_id']
-    date = request.form['date']
+    portfolio_id = int(request.form['portfolio_id'])
+    date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
     stock_ticker = request.form['stock_ticker']
     stock_price = float(request.form['stock_price'])
     transaction_type = request.form['transaction_type']
@@ -140,7 +162,7 @@ def add_transaction():
     total_transaction_cost = stock_price * stock_quantity + transaction_cost
     
     new_transaction = Transaction(
-        user_id=user.id,
+        user_id=g.current_user.id,
         portfolio_id=portfolio_id,
         date=date,
         stock_ticker=stock_ticker,
@@ -153,6 +175,7 @@ def add_transaction():
     )
     
     db.session.add(new_transaction)
+    apply_transaction(new_transaction)
     db.session.commit()
     
     flash('Transaction added successfully.')
@@ -160,20 +183,89 @@ def add_transaction():
 
 @transactions_bp.route('/create_portfolio', methods=['GET', 'POST'])
 def create_portfolio():
-    if 'user' not in session:
+    if not g.current_user:
         flash('You need to be logged in to create a portfolio.')
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
     
     if request.method == 'POST':
         portfolio_name = request.form['portfolio_name']
-        user = User.query.filter_by(username=session['user']).first()
-        
-        if user:
-            new_portfolio = Portfolio(name=portfolio_name, user_id=user.id)
-            db.session.add(new_portfolio)
-            db.session.commit()
-            flash('Portfolio created successfully.')
-        else:
-            flash('User not found.')
+        new_portfolio = Portfolio(name=portfolio_name, user_id=g.current_user.id)
+        db.session.add(new_portfolio)
+        db.session.commit()
+        flash('Portfolio created successfully.')
     
-    return redirect(url_for('transactions.transactions'))
\ No newline at end of file
+    return redirect(url_for('transactions.transactions'))
+
+@transactions_bp.route('/performance')
+def performance():
+    if not g.current_user:
+        flash('You need to be logged in to view this page.')
+        return redirect(url_for('auth.login'))
+
+    portfolios = Portfolio.query.filter_by(user_id=g.current_user.id).order_by(Portfolio.id).all()
+    portfolio_id = request.args.get('portfolio_id', type=int)
+    portfolio = next((p for p in portfolios if p.id == portfolio_id), portfolios[0] if portfolios else None)
+    period = request.args.get('period', 'monthly')
+    if period not in PERFORMANCE_PERIODS:
+        period = 'monthly'
+
+    rows = []
+    if portfolio is not None:
+        # Appends the days since the last update; everything else is read from the stored series
+        try:
+            update_nav(portfolio.id)
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Could not update the portfolio value: {e}')
+        performance_table = period_performance(portfolio.id, period)
+        rows = list(performance_table.itertuples())
+
+    return render_template('performance.html', portfolios=portfolios, portfolio=portfolio, period=period,
+                           periods=list(PERFORMANCE_PERIODS), rows=rows)
+
+@transactions_bp.route('/dividends')
+def dividends():
+    if not g.current_user:
+        flash('You need to be logged in to view this page.')
+        return redirect(url_for('auth.login'))
+
+    portfolios = Portfolio.query.filter_by(user_id=g.current_user.id).order_by(Portfolio.id).all()
+    portfolio_id = request.args.get('portfolio_id', type=int)
+    portfolio_ids = [p.id for p in portfolios if portfolio_id is None or p.id == portfolio_id]
+
+    # Only the local dividends table is read; `flask ingest-dividends` fills it
+    received, expected = dividend_income(portfolio_ids) if portfolio_ids else (None, None)
+    totals = {}
+    if received is not None:
+        year_start = date(date.today().year, 1, 1)
+        this_year = received[received['ex_date'] >= str(year_start)]
+        for name, frame in (('received', received), ('this_year', this_year), ('expected', expected)):
+            for currency, income in frame.groupby('currency')['income'].sum().items():
+                totals.setdefault(currency, {'received': 0.0, 'this_year': 0.0, 'expected': 0.0})[name] = income
+
+    return render_template('dividends.html', portfolios=portfolios, portfolio_id=portfolio_id, totals=totals,
+                           received=list(received.itertuples()) if received is not None else [],
+                           expected=list(expected.itertuples()) if expected is not None else [])
+
+@transactions_bp.route('/tax_report')
+def tax_report():
+    if not g.current_user:
+        flash('You need to be logged in to view this page.')
+        return redirect(url_for('auth.login'))
+
+    portfolios = Portfolio.query.filter_by(user_id=g.current_user.id).order_by(Portfolio.id).all()
+    portfolio_id = request.args.get('portfolio_id', type=int)
+    portfolio_ids = [p.id for p in portfolios if portfolio_id is None or p.id == portfolio_id]
+    year = request.args.get('year', type=int) or date.today().year - 1
+
+    rows, summary = [], None
+    if portfolio_ids:
+        try:
+            report, summary = build_tax_report(portfolio_ids, year)
+            rows = list(report.itertuples())
+        except ValueError as e:
+            flash(str(e))
+
+    return render_template('tax_report.html', portfolios=portfolios, portfolio_id=portfolio_id, year=year,
+                           years=list(range(date.today().year, date.today().year - 15, -1)), rows=rows,
+                           summary=summary, time_test_years=TIME_TEST_YEARS)
@@ -0,0 +1,120 @@
+import base64
+from datetime import date
+import json
+from flask import current_app
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Trace attributes that hold one entry per point
+PER_POINT_KEYS = ('text', 'hovertext', 'customdata')
+
+def lttb(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; every bucket in between
+    keeps the point forming the largest triangle with the previously kept
+    point and the average of the next bucket, which preserves peaks and
+    troughs far better than taking every n-th point.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    # Averages of every bucket (plus the last point as the final "next bucket")
+    starts = np.append(edges[:-1], n - 1)
+    counts = np.diff(np.append(starts, n))
+    avg_x = np.add.reduceat(x, starts) / counts
+    avg_y = np.add.reduceat(y, starts) / counts
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        area = np.abs((x[a] - avg_x[i + 1]) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def encode_array(values, dtype='f8'):
+    """Plotly.js typed-array spec: the raw little-endian bytes, base64 encoded."""
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+def _as_numbers(values):
+    # Returns (float array, is_date) or None for categories and anything else that can not be typed
+    if isinstance(values, dict):
+        # Newer plotly versions already hand out typed-array specs
+        if 'bdata' not in values or 'shape' in values:
+            return None
+        values = np.frombuffer(base64.b64decode(values['bdata']), dtype=np.dtype(values['dtype']).newbyteorder('<'))
+    array = np.asarray(values)
+    if array.ndim != 1:
+        return None
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[ms]').astype('int64').astype(float), True
+    if array.dtype.kind in 'biuf':
+        return array.astype(float), False
+    if array.dtype.kind == 'O' and len(array) and isinstance(array[0], (date, np.datetime64)):
+        return pd.to_datetime(array).to_numpy('datetime64[ms]').astype('int64').astype(float), True
+    return None
+
+def _axis_name(reference, axis):
+    # 'x' -> 'xaxis', 'x2' -> 'xaxis2'
+    reference = reference or axis
+    return f'{axis}axis{reference[1:]}'
+
+def compact_figure_dict(figure, max_points):
+    """Downsample scatter traces to `max_points` and replace their x/y lists with typed arrays (in place)."""
+    date_axes = set()
+    for trace in figure.get('data', []):
+        if trace.get('type', 'scatter') not in ('scatter', 'scattergl') or 'y' not in trace:
+            continue
+        y = _as_numbers(trace['y'])
+        if y is None:
+            continue
+        y = y[0]
+        if 'x' in trace:
+            x = _as_numbers(trace['x'])
+            if x is None:
+                continue
+            x, is_date = x
+        else:
+            x, is_date = np.arange(len(y), dtype=float), False
+
+        keep = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if max_points:
+            keep = keep[lttb(x[keep], y[keep], max_points)]
+        x, y = x[keep], y[keep]
+        # Per-point hover data has to follow the kept points
+        for key in PER_POINT_KEYS:
+            values = trace.get(key)
+            if values is not None and not isinstance(values, str) and len(values) == len(trace['y']):
+                trace[key] = np.asarray(values)[keep].tolist()
+
+        # Week/month counters fit in int32; epoch milliseconds need float64
+        integral = not is_date and len(x) and np.all(x == np.round(x)) and np.abs(x).max() < 2 ** 31
+        trace['x'] = encode_array(x, 'i4' if integral else 'f8')
+        trace['y'] = encode_array(y, 'f4')
+        if is_date:
+            date_axes.add(_axis_name(trace.get('xaxis'), 'x'))
+
+    layout = figure.setdefault('layout', {})
+    for axis in date_axes:
+        # Dates travel as epoch milliseconds, which a date axis reads natively
+        layout.setdefault(axis, {})['type'] = 'date'
+    return figure
+
+def figure_json(fig):
+    """Serialize a figure for the browser, in the compact payload mode unless CHART_PAYLOAD_MODE is 'full'."""
+    import plotly.io as pio
+    from plotly.utils import PlotlyJSONEncoder
+    if current_app.config.get('CHART_PAYLOAD_MODE', 'compact') == 'full':
+        return pio.to_json(fig)
+    figure = compact_figure_dict(fig.to_plotly_json(), current_app.config.get('CHART_MAX_POINTS', 1500))
+    return json.dumps(figure, cls=PlotlyJSONEncoder)
@@ -0,0 +1,75 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+from flask import g, session
+from app.db_extension import db
+from app.models import User
+
+CurrentUser = namedtuple('CurrentUser', ['id', 'username', 'is_admin', 'status'])
+
+class UserCache:
+    """Small per-process cache of user role and status, keyed by user id.
+
+    Admin changes call invalidate() so the worker that handled them sees the
+    change at once; other workers pick it up when the TTL expires.
+    """
+
+    def __init__(self, ttl_seconds=60, max_size=1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user id -> (CurrentUser, loaded_at)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('USER_CACHE_TTL_SECONDS', self.ttl_seconds)
+        app.before_request(load_current_user)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        row = db.session.query(User.id, User.username, User.is_admin, User.status).filter(User.id == user_id).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        user = CurrentUser(row.id, row.username, bool(row.is_admin), row.status)
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_cache = UserCache()
+
+def load_current_user():
+    # Resolve the logged-in user once per request into g.current_user
+    g.current_user = None
+    user_id = session.get('user_id')
+    if user_id is None and 'user' in session:
+        # Sessions created before user ids were stored only carry the username
+        row = db.session.query(User.id).filter_by(username=session['user']).first()
+        user_id = row.id if row else None
+        if user_id is not None:
+            session['user_id'] = user_id
+    if user_id is None:
+        return
+
+    user = user_cache.get(user_id)
+    if user is None or user.status == 'locked':
+        # The account was deleted or locked by an admin
+        session.pop('user', None)
+        session.pop('user_id', None)
+        return
+    g.current_user = user
+
+def current_user_is_admin():
+    user = g.get('current_user')
+    return bool(user and user.is_admin)
@@ -1,30 +1,147 @@
-from dash import Dash, dash_table, html, Input, Output, State, callback_context
-from flask import Flask, session
-from datetime import datetime
+from dash import Dash, dash_table, html, Input, Output, State, callback_context, no_update
+from flask import Flask, current_app, g
+from datetime import datetime, timedelta
+import math
 from app.models import db, Todo, User  # Import the db instance, Todo model, and User model
+from app.current_user import load_current_user
 
-def fetch_up_to_date_data_from_db(server):
-    with server.app_context():
-        # Fetch data from the database
-        todos = db.session.query(Todo, User).join(User, Todo.user_id == User.id).all()
-        data = [
-            {
-                'id': todo.id,
-                'title': todo.title,
-                'status': todo.status,
-                'description': todo.description,
-                'version': todo.version,
-                'creation_date': todo.creation_date.strftime('%Y-%m-%d %H:%M'),
-                'done_date': todo.done_date.strftime('%Y-%m-%d %H:%M') if todo.done_date else '',
-                'username': user.username
-            } for todo, user in todos
-        ]
-    return data
+PAGE_SIZE = 12
+
+# Columns the user may edit; only these are written back
+EDITABLE_COLUMNS = ('title', 'status', 'description', 'version')
+
+# Table column id -> SQL column used by the custom filters
+FILTER_COLUMNS = {
+    'id': Todo.id,
+    'title': Todo.title,
+    'status': Todo.status,
+    'description': Todo.description,
+    'version': Todo.version,
+    'creation_date': Todo.creation_date,
+    'done_date': Todo.done_date,
+    'username': User.username
+}
+
+# Dash filter operators (both spellings) -> comparison
+FILTER_OPERATORS = {
+    '=': 'eq', 'eq': 'eq',
+    '!=': 'ne', 'ne': 'ne',
+    '<': 'lt', 'lt': 'lt',
+    '<=': 'le', 'le': 'le',
+    '>': 'gt', 'gt': 'gt',
+    '>=': 'ge', 'ge': 'ge',
+    'contains': 'contains',
+    'datestartswith': 'datestartswith'
+}
+# Case-insensitive (i) and case-sensitive (s) spellings map to the same comparison
+FILTER_OPERATORS.update({prefix + name: operator for name, operator in list(FILTER_OPERATORS.items()) for prefix in 'is'})
+
+def todo_row(todo, username):
+    return {
+        'id': todo.id,
+        'title': todo.title,
+        'status': todo.status,
+        'description': todo.description,
+        'version': todo.version,
+        'creation_date': todo.creation_date.strftime('%Y-%m-%d %H:%M'),
+        'done_date': todo.done_date.strftime('%Y-%m-%d %H:%M') if todo.done_date else '',
+        'username': username
+    }
+
+def _date_prefix_range(prefix):
+    # '2024', '2024-05' or '2024-05-17' -> [start, end) of that year, month or day
+    parts = [int(part) for part in prefix.split('-')[:3]]
+    if len(parts) == 1:
+        return datetime(parts[0], 1, 1), datetime(parts[0] + 1, 1, 1)
+    if len(parts) == 2:
+        year, month = parts
+        return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+    start = datetime(*parts)
+    return start, start + timedelta(days=1)
+
+def parse_filter_term(term):
+    """SQL condition for one `{column} operator value` term of a Dash filter_query, or None if it can not be used."""
+    term = term.strip()
+    if not term.startswith('{') or '}' not in term:
+        return None
+    name, rest = term[1:].split('}', 1)
+    operator, _, value = rest.strip().partition(' ')
+    column = FILTER_COLUMNS.get(name)
+    operator = FILTER_OPERATORS.get(operator)
+    if column is None or operator is None:
+        return None
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        value = value[1:-1]
+
+    if name in ('creation_date', 'done_date'):
+        try:
+            start, end = _date_prefix_range(value)
+        except ValueError:
+            return None
+        if operator in ('eq', 'datestartswith', 'contains'):
+            return (column >= start) & (column < end)
+        comparisons = {'ne': (column < start) | (column >= end), 'lt': column < start, 'le': column < end,
+                       'gt': column >= end, 'ge': column >= start}
+        return comparisons[operator]
+
+    if name == 'id':
+        try:
+            value = int(value)
+        except ValueError:
+            return None
+    if operator in ('contains', 'datestartswith'):
+        pattern = f'%{value}%' if operator == 'contains' else f'{value}%'
+        return db.cast(column, db.String).ilike(pattern)
+    return {'eq': column == value, 'ne': column != value, 'lt': column < value, 'le': column <= value,
+            'gt': column > value, 'ge': column >= value}[operator]
+
+def todo_query(filter_query):
+    """Todo and username query with the table's filter_query applied as WHERE conditions."""
+    query = db.session.query(Todo, User.username).join(User, Todo.user_id == User.id)
+    for term in (filter_query or '').split(' && '):
+        condition = parse_filter_term(term)
+        if condition is not None:
+            query = query.filter(condition)
+    return query
+
+def fetch_todo_page(filter_query, page_current, page_size):
+    """One page of todos (LIMIT/OFFSET in SQL) and the number of pages for the filter."""
+    query = todo_query(filter_query)
+    total = query.count()
+    rows = query.order_by(Todo.id).limit(page_size).offset(page_current * page_size).all()
+    return [todo_row(todo, username) for todo, username in rows], max(math.ceil(total / page_size), 1)
+
+def changed_rows(rows, previous_rows):
+    """{todo id: {column: new value}} for the editable cells that differ between the two versions of the page."""
+    previous = {row['id']: row for row in previous_rows or []}
+    changes = {}
+    for row in rows or []:
+        before = previous.get(row['id'])
+        if before is None:
+            continue
+        diff = {column: row.get(column) for column in EDITABLE_COLUMNS if row.get(column) != before.get(column)}
+        if diff:
+            changes[row['id']] = diff
+    return changes
+
+def save_changes(changes, rows):
+    # All changed todos are loaded in one query and written in one commit
+    todos = Todo.query.filter(Todo.id.in_(list(changes))).all()
+    rows_by_id = {row['id']: row for row in rows}
+    for todo in todos:
+        for column, value in changes[todo.id].items():
+            setattr(todo, column, value)
+        if todo.status == 'Completed' and not todo.done_date:
+            todo.done_date = datetime.now()
+            rows_by_id[todo.id]['done_date'] = todo.done_date.strftime('%Y-%m-%d %H:%M')
+    db.session.commit()
+    return rows
 
 def init_dash(server):
     app = Dash(__name__, server=server, url_base_pathname='/dash/')
 
-    # Create the data table layout
+    # Create the data table layout; rows are loaded page by page by the callback
     app.layout = html.Div([
         dash_table.DataTable(
             id='todo-table',
@@ -38,7 +155,7 @@ def init_dash(server):
                 {'name': 'Done Date', 'id': 'done_date', 'editable': False},
                 {'name': 'Username', 'id': 'username', 'editable': False}
             ],
-            data=fetch_up_to_date_data_from_db(server),
+            data=[],
             editable=True,
             row_deletable=False,
             dropdown={
@@ -51,9 +168,11 @@ def init_dash(server):
                     ]
                 }
             },
-            filter_action='native',  # Enable header filtering
-            page_action='native',    # Enable pagination
-            page_size=12,            # Number of rows per page
+            filter_action='custom',  # Header filters are run as SQL WHERE conditions
+            filter_query='',
+            page_action='custom',    # Pages are fetched with LIMIT/OFFSET
+            page_current=0,
+            page_size=PAGE_SIZE,     # Number of rows per page
             style_cell={
                 'fontFamily': 'Arial, sans-serif',  # Set the font family
                 'fontSize': '14px',  # Set the font size
@@ -70,65 +189,67 @@ def init_dash(server):
         html.Button('Refresh Data', id='refresh-button', n_clicks=0)  # Add refresh button
     ])
 
+    # Callbacks run inside the Flask request, so g.current_user and the db session are available
     @app.callback(
-        Output('todo-table', 'data'),
+        [Output('todo-table', 'data'),
+         Output('todo-table', 'page_count')],
         [Input('todo-table', 'data_timestamp'),
+         Input('todo-table', 'page_current'),
+         Input('todo-table', 'page_size'),
+         Input('todo-table', 'filter_query'),
          Input('create-button', 'n_clicks'),
          Input('refresh-button', 'n_clicks')],  # Add refresh button input
-        [State('todo-table', 'data')]
+        [State('todo-table', 'data'),
+         State('todo-table', 'data_previous')]
     )
-    def update_database(timestamp, create_clicks, refresh_clicks, rows):
+    def update_database(timestamp, page_current, page_size, filter_query, create_clicks, refresh_clicks, rows,
+                        previous_rows):
         ctx = callback_context
+        triggered = ctx.triggered[0]['prop_id'] if ctx.triggered else ''
+
+        if triggered == 'todo-table.data_timestamp':
+            # A cell edit: write only the rows that differ from the previous version of the page
+            changes = changed_rows(rows, previous_rows)
+            if not changes:
+                return no_update, no_update
+            return save_changes(changes, rows), no_update
 
-        if not ctx.triggered:
-            return rows
-
-        button_id = ctx.triggered[0]['prop_id'].split('.')[0]
-
-        if button_id == 'create-button':
-            with server.app_context():
-                username = session.get('user')
-                if not username:
-                    print("No user found in session")
-                    return rows
-                user = User.query.filter_by(username=username).first()
-                if not user:
-                    print("No user found in database")
-                    return rows
-                new_todo = Todo(
-                    title='New Task',
-                    status='Not Started',
-                    description='',
-                    version='',
-                    creation_date=datetime.now(),
-                    user_id=user.id
-                )
-                db.session.add(new_todo)
-                db.session.commit()
-
-        elif button_id == 'refresh-button':
-            return fetch_up_to_date_data_from_db(server)
-
-        else:
-            with server.app_context():
-                for row in rows:
-                    todo = Todo.query.get(row['id'])
-                    if todo:
-                        todo.title = row['title']
-                        todo.status = row['status']
-                        todo.description = row['description']
-                        todo.version = row['version']
-                        if row['status'] == 'Completed' and not todo.done_date:
-                            todo.done_date = datetime.now()
-                            row['done_date'] = todo.done_date.strftime('%Y-%m-%d %H:%M')
-                        db.session.commit()
-
-        return fetch_up_to_date_data_from_db(server)
+        if triggered == 'create-button.n_clicks':
+            user = g.get('current_user')
+            if not user:
+                current_app.logger.warning("Todo create without a logged in user")
+                return no_update, no_update
+            new_todo = Todo(
+                title='New Task',
+                status='Not Started',
+                description='',
+                version='',
+                creation_date=datetime.now(),
+                user_id=user.id
+            )
+            db.session.add(new_todo)
+            db.session.commit()
+
+        # First load, paging, filtering, refresh and create all read just the current page
+        return fetch_todo_page(filter_query, page_current or 0, page_size or PAGE_SIZE)
 
     return app
 
+def create_dash_server(app):
+    """Flask server for the Dash board with the main app's config, database and logged-in user.
+
+    Built by the /dash/ dispatcher in create_app on the first request, so
+    Dash is never imported by workers that do not serve the board.
+    """
+    server = Flask(__name__)
+    server.config.from_mapping(app.config)
+    db.init_app(server)
+    server.before_request(load_current_user)
+    init_dash(server)
+    return server
+
 # Example of how to initialize the Dash app with a Flask server
 if __name__ == '__main__':
     server = Flask(__name__)
     app = init_dash(server)
-    server.run(debug=True)
\ No newline at end of file
+    server.run(debug=True)
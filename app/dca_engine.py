@@ -0,0 +1,297 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+
+def parse_weights(text):
+    # "AAPL:2, MSFT:1" -> {'AAPL': 2.0, 'MSFT': 1.0}
+    weights = {}
+    if not text:
+        return weights
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        ticker, _, weight = item.partition(':')
+        weight = float(weight)
+        if weight < 0:
+            raise ValueError(f'Weight for {ticker.strip()} must not be negative.')
+        weights[ticker.strip().upper()] = weight
+    return weights
+
+def normalize_weights(stocks, weights=None):
+    """Return per-stock weights summing to 1; stocks without an explicit weight count as 1."""
+    if not weights:
+        return np.full(len(stocks), 1 / len(stocks))
+    raw = np.array([weights.get(stock, 1.0) for stock in stocks], dtype=float)
+    if raw.sum() <= 0:
+        raise ValueError('At least one stock needs a positive weight.')
+    return raw / raw.sum()
+
+def run_dca(stock_prices, investment_amount, weights=None):
+    """Vectorized DCA backtest over a (period x stock) price matrix.
+
+    One contribution is made per row, split by weight across the stocks
+    that have a price in that row; a stock without one (e.g. before its
+    listing) gets nothing and the others' weights are scaled up. Only rows
+    without any usable price are skipped. Returns the same tuple as
+    calculate_dca_stocks(); missing prices come back as None.
+    """
+    stocks = list(stock_prices.columns)
+    prices = stock_prices.to_numpy(dtype=float)
+    priced = ~np.isnan(prices)
+    row_weights = np.where(priced, normalize_weights(stocks, weights), 0.0)
+    valid = row_weights.sum(axis=1) > 0
+    prices, priced, row_weights = prices[valid], priced[valid], row_weights[valid]
+    dates = stock_prices.index[valid]
+
+    if len(prices) == 0:
+        empty = lambda: {stock: [] for stock in stocks}
+        return 0, 0, [], [], [], empty(), empty(), empty(), []
+
+    allocation = investment_amount * row_weights / row_weights.sum(axis=1, keepdims=True)
+    shares_purchased = np.divide(allocation, prices, out=np.zeros_like(prices), where=priced)
+    holdings = np.cumsum(shares_purchased, axis=0)
+    # A held stock whose price is missing later on is valued at its last known price
+    last_prices = np.where(priced, prices, np.nan)
+    filled = np.maximum.accumulate(np.where(priced, np.arange(len(prices))[:, None], 0), axis=0)
+    last_prices = np.nan_to_num(last_prices[filled, np.arange(len(stocks))])
+    values = np.einsum('ij,ij->i', holdings, last_prices)
+    contributions = investment_amount * np.arange(1, len(prices) + 1)
+    profit_percentages = np.round((values - contributions) / contributions * 100, 2)
+
+    purchased_rounded = np.round(shares_purchased, 4)
+    holdings_rounded = np.round(holdings, 4)
+    prices_rounded = np.round(prices, 2).astype(object)
+    prices_rounded[~priced] = None
+    purchased_stocks = {stock: purchased_rounded[:, i].tolist() for i, stock in enumerate(stocks)}
+    total_stocks_owned = {stock: holdings_rounded[:, i].tolist() for i, stock in enumerate(stocks)}
+    stock_prices_list = {stock: prices_rounded[:, i].tolist() for i, stock in enumerate(stocks)}
+    contribution_dates = dates.strftime('%Y-%m-%d').tolist()
+
+    total_investment = float(contributions[-1])
+    final_amount = float(values[-1])
+    return (total_investment, final_amount, values.tolist(), contributions.tolist(), profit_percentages.tolist(),
+            purchased_stocks, total_stocks_owned, stock_prices_list, contribution_dates)
+
+CONTRIBUTION_INTERVALS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'semiannually': 6,
+    'annually': 12
+}
+
+def scenario_grid(annual_returns, years, contribution_frequencies, monthly_investments):
+    """Cartesian product of the parameter lists as flat, equally long arrays."""
+    axes = [np.asarray(annual_returns, dtype=float), np.asarray(years, dtype=int),
+            np.asarray(contribution_frequencies, dtype=object), np.asarray(monthly_investments, dtype=float)]
+    index = np.meshgrid(*[np.arange(len(axis)) for axis in axes], indexing='ij')
+    return tuple(axis[i.ravel()] for axis, i in zip(axes, index))
+
+def _annuity_value(initial_investment, monthly_investment, growth, interval, months):
+    # Contributions land at months c, 2c, ..., n*c and each grows by g^(t - j + 1) until month t
+    n = months // interval
+    growth_per_interval = growth ** interval
+    with np.errstate(divide='ignore', invalid='ignore'):
+        geometric = np.where(np.isclose(growth_per_interval, 1), n,
+                             (growth_per_interval ** n - 1) / (growth_per_interval - 1))
+    value = initial_investment * growth ** months + monthly_investment * growth ** (months + 1 - n * interval) * geometric
+    return value, initial_investment + monthly_investment * n
+
+def calculate_dca_batch(initial_investment, monthly_investment, annual_return, years, contribution_frequency, series_step=12):
+    """Evaluate many calculator scenarios at once with closed-form annuity math.
+
+    Arguments are scalars or equally long arrays (one entry per scenario).
+    Account values are sampled every `series_step` months; samples past a
+    scenario's horizon are NaN. Compounding is exact, without the per-step
+    rounding of calculate_dca().
+    """
+    initial_investment, monthly_investment, annual_return, years, contribution_frequency = (
+        np.atleast_1d(a) for a in np.broadcast_arrays(
+            np.asarray(initial_investment, dtype=float), np.asarray(monthly_investment, dtype=float),
+            np.asarray(annual_return, dtype=float), np.asarray(years, dtype=int),
+            np.asarray(contribution_frequency, dtype=object)))
+    intervals = np.array([CONTRIBUTION_INTERVALS[f] for f in contribution_frequency], dtype=int)
+    horizons = years * 12
+    growth = (1 + annual_return / 100) ** (1 / 12)
+
+    sample_months = np.arange(0, horizons.max(initial=0) + 1, series_step)
+    values, contributions = _annuity_value(initial_investment[:, None], monthly_investment[:, None],
+                                           growth[:, None], intervals[:, None], sample_months[None, :])
+    beyond = sample_months[None, :] > horizons[:, None]
+    values[beyond] = np.nan
+    contributions[beyond] = np.nan
+
+    final_amount, total_investment = _annuity_value(initial_investment, monthly_investment, growth, intervals, horizons)
+    profit = final_amount - total_investment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit_percentage = np.where(total_investment != 0, profit / total_investment * 100, np.nan)
+
+    return {
+        'months': sample_months,
+        'values': values,
+        'contributions': contributions,
+        'total_investment': total_investment,
+        'final_amount': final_amount,
+        'profit': profit,
+        'profit_percentage': profit_percentage
+    }
+
+MONTE_CARLO_PERCENTILES = (5, 50, 95)
+# Paths x months simulated at once per process; a chunk holds a handful of float64 matrices of this size
+MONTE_CARLO_CHUNK_ELEMENTS = 2000000
+# Quantile points per month each chunk reports for merging the bands, and chunks merged at a time
+QUANTILE_SKETCH_POINTS = 1001
+SKETCH_MERGE_BATCH = 8
+
+# Default pool size; every web worker process gets its own pool
+DEFAULT_POOL_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None
+
+def _get_executor(max_workers=None):
+    # Spawned children do not inherit Flask state or threads, but unpickling _simulate_chunk imports
+    # app.dca_engine and so runs app/__init__ once in every child; keep the pool small
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers or DEFAULT_POOL_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def _reset_executor():
+    # A child that died (e.g. killed for memory) breaks the pool for good; the next run starts a new one
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def draw_monthly_returns(rng, paths, months, distribution='normal', annual_return=7.0, volatility=15.0,
+                         degrees_of_freedom=5, historical_returns=None):
+    """Draw a (paths x months) matrix of simple monthly returns."""
+    if distribution == 'bootstrap':
+        if historical_returns is None or len(historical_returns) == 0:
+            raise ValueError('Bootstrap mode needs historical monthly returns.')
+        return rng.choice(np.asarray(historical_returns, dtype=float), size=(paths, months))
+
+    mean = (1 + annual_return / 100) ** (1 / 12) - 1
+    scale = volatility / 100 / np.sqrt(12)
+    if distribution == 'normal':
+        returns = rng.normal(mean, scale, size=(paths, months))
+    elif distribution == 'student_t':
+        # Rescale so the standard deviation matches `volatility`
+        shocks = rng.standard_t(degrees_of_freedom, size=(paths, months))
+        returns = mean + scale * shocks * np.sqrt((degrees_of_freedom - 2) / degrees_of_freedom)
+    else:
+        raise ValueError(f'Unknown distribution: {distribution}')
+    # A month can not lose more than everything
+    return np.maximum(returns, -0.99)
+
+def simulate_dca_paths(returns, initial_investment, monthly_investment, contribution_interval):
+    """Account value paths for a returns matrix; column t is the value after month t (column 0 is the start)."""
+    paths, months = returns.shape
+    contributes = (np.arange(1, months + 1) % contribution_interval == 0)
+    growth = np.cumprod(1 + returns, axis=1)
+    # V_t = G_t * (I + m * sum_{j<=t, contribution month} 1 / G_{j-1})
+    previous_growth = np.hstack([np.ones((paths, 1)), growth[:, :-1]])
+    deposits = np.cumsum(np.where(contributes, monthly_investment / previous_growth, 0.0), axis=1)
+    values = np.empty((paths, months + 1))
+    values[:, 0] = initial_investment
+    values[:, 1:] = growth * (initial_investment + deposits)
+    return values
+
+def _simulate_chunk(seed, paths, months, initial_investment, monthly_investment, contribution_interval,
+                    return_params, percentiles):
+    rng = np.random.default_rng(seed)
+    returns = draw_monthly_returns(rng, paths, months, **return_params)
+    values = simulate_dca_paths(returns, initial_investment, monthly_investment, contribution_interval)
+    total_investment = initial_investment + monthly_investment * (months // contribution_interval)
+    final = values[:, -1]
+    return {
+        'paths': paths,
+        'bands': np.percentile(values, percentiles, axis=0),
+        'sketch': np.percentile(values, np.linspace(0, 100, QUANTILE_SKETCH_POINTS), axis=0),
+        'final_sum': float(final.sum()),
+        'losses': int((final < total_investment).sum())
+    }
+
+def merge_quantile_sketches(sketches, paths, points=QUANTILE_SKETCH_POINTS):
+    """Merge (k x months) quantile sketches covering `paths` paths each into one sketch of `points` quantiles.
+
+    Every sketch row stands for an equal share of its paths. The rows are
+    pooled, ranked per month by their weights and read off at evenly
+    spaced quantile levels, so the result has the same shape as one
+    chunk's sketch and merging can be repeated.
+    """
+    values = np.concatenate(sketches)
+    weights = np.concatenate([np.full(len(sketch), count / len(sketch)) for sketch, count in zip(sketches, paths)])
+    order = np.argsort(values, axis=0)
+    values = np.take_along_axis(values, order, axis=0)
+    weights = weights[order]
+    ranks = (np.cumsum(weights, axis=0) - weights / 2) / weights.sum(axis=0)
+    levels = np.linspace(0, 1, points)
+    return np.stack([np.interp(levels, ranks[:, month], values[:, month]) for month in range(values.shape[1])], axis=1)
+
+def sketch_percentiles(sketch, percentiles):
+    # The sketch rows are evenly spaced quantile levels from 0 to 100
+    levels = np.linspace(0, 100, len(sketch))
+    return np.stack([[np.interp(p, levels, sketch[:, month]) for month in range(sketch.shape[1])] for p in percentiles])
+
+def run_monte_carlo_dca(initial_investment, monthly_investment, years, contribution_frequency, paths=100000,
+                        seed=None, percentiles=MONTE_CARLO_PERCENTILES, chunk_size=None,
+                        max_workers=None, **return_params):
+    """Monte Carlo DCA: percentile bands of the account value over `paths` simulated paths.
+
+    Paths are simulated in chunks of at most MONTE_CARLO_CHUNK_ELEMENTS
+    path-months so memory per process stays bounded whatever the horizon;
+    runs larger than one chunk are spread over a process pool. A single
+    chunk gives exact bands. Several are folded into one quantile sketch
+    (see merge_quantile_sketches) a batch at a time as they finish, so the
+    bands are estimates (`approximate_bands`) within a fraction of a
+    percentile and memory does not grow with the number of chunks.
+    """
+    months = years * 12
+    contribution_interval = CONTRIBUTION_INTERVALS[contribution_frequency]
+    chunk_size = chunk_size or max(MONTE_CARLO_CHUNK_ELEMENTS // (months + 1), 1)
+    chunk_sizes = [chunk_size] * (paths // chunk_size)
+    if paths % chunk_size:
+        chunk_sizes.append(paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    jobs = [(chunk_seed, size, months, initial_investment, monthly_investment, contribution_interval,
+             return_params, percentiles) for chunk_seed, size in zip(seeds, chunk_sizes)]
+
+    if len(jobs) == 1:
+        chunks = [_simulate_chunk(*jobs[0])]
+    else:
+        executor = _get_executor(max_workers)
+        chunks = []
+        sketch, sketch_paths, pending = None, 0, []
+        try:
+            for chunk in executor.map(_simulate_chunk, *zip(*jobs)):
+                pending.append((chunk.pop('sketch'), chunk['paths']))
+                chunks.append(chunk)
+                if len(pending) == SKETCH_MERGE_BATCH or len(chunks) == len(jobs):
+                    if sketch is not None:
+                        pending.append((sketch, sketch_paths))
+                    sketch = merge_quantile_sketches(*zip(*pending))
+                    sketch_paths = sum(count for _, count in pending)
+                    pending = []
+        except BrokenProcessPool:
+            _reset_executor()
+            raise
+
+    if len(chunks) == 1:
+        bands = chunks[0]['bands']
+    else:
+        bands = sketch_percentiles(sketch, percentiles)
+    total_investment = initial_investment + monthly_investment * (months // contribution_interval)
+    return {
+        'months': np.arange(months + 1),
+        'bands': {p: bands[i] for i, p in enumerate(percentiles)},
+        'contributions': initial_investment + monthly_investment * (np.arange(months + 1) // contribution_interval),
+        'total_investment': total_investment,
+        'mean_final_amount': sum(chunk['final_sum'] for chunk in chunks) / paths,
+        'probability_of_loss': sum(chunk['losses'] for chunk in chunks) / paths,
+        'approximate_bands': len(chunks) > 1
+    }
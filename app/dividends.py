@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import time
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.models import Dividend, DividendCoverage, Transaction
+from app.price_store import DEFAULT_START_DATE, upsert_rows, yf_download
+from app.lazy import lazy_import
+pd = lazy_import('pandas')
+
+# Recent days fetched again on every run, for late or corrected announcements
+REFETCH_DAYS = 30
+
+def download_dividends(tickers, start, end):
+    """Download dividend events for a batch of tickers.
+
+    Returns (ticker, ex_date, amount) insert rows and the tickers that came
+    back with any price bar, i.e. whose (possibly empty) dividend history
+    was actually fetched.
+    """
+    # yfinance treats `end` as exclusive
+    data = yf_download(list(tickers), start=start.strftime('%Y-%m-%d'),
+                       end=(end + timedelta(days=1)).strftime('%Y-%m-%d'),
+                       interval='1d', actions=True, auto_adjust=False, progress=False, group_by='column')
+    if data is None or data.empty or 'Dividends' not in data:
+        return [], []
+    closes = data['Close'] if 'Close' in data else pd.DataFrame()
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(name=tickers[0])
+    returned = sorted(str(ticker) for ticker in closes.columns[closes.notna().any()])
+
+    values = data['Dividends']
+    if isinstance(values, pd.Series):
+        values = values.to_frame(name=tickers[0])
+    events = values.rename_axis(index='ex_date', columns='ticker').reset_index().melt(
+        id_vars='ex_date', var_name='ticker', value_name='amount')
+    events = events[events['amount'] > 0]
+    rows = [
+        {'ticker': ticker, 'ex_date': pd.Timestamp(ex_date).date(), 'amount': float(amount)}
+        for ex_date, ticker, amount in events.itertuples(index=False)
+    ]
+    return rows, returned
+
+def portfolio_tickers():
+    """Every ticker that appears in any transaction."""
+    return sorted(ticker for (ticker,) in db.session.query(Transaction.stock_ticker).distinct())
+
+def plan_dividend_ingest(tickers, chunk_size=50):
+    # New tickers get their full history; known ones only the last REFETCH_DAYS before their checkpoint onwards
+    coverage = {c.ticker: c.end_date for c in DividendCoverage.query.filter(DividendCoverage.ticker.in_(tickers)).all()}
+    pending = {}
+    for ticker in sorted(set(tickers)):
+        start = coverage[ticker] - timedelta(days=REFETCH_DAYS) if ticker in coverage else DEFAULT_START_DATE
+        pending.setdefault(start, []).append(ticker)
+    return [(start, batch[i:i + chunk_size])
+            for start, batch in sorted(pending.items())
+            for i in range(0, len(batch), chunk_size)]
+
+def ingest_dividends(tickers, chunk_size=50, progress=None):
+    """Fetch dividend history in batched downloads and upsert it on (ticker, ex_date), one transaction per chunk.
+
+    Downloads run one at a time (yf.download keeps module-global state) on
+    a background thread that fetches the next chunk while the previous one
+    is written. Only tickers that came back from the download get their
+    DividendCoverage checkpoint moved; the rest are retried by the next run.
+    """
+    started = time.perf_counter()
+    end = date.today()
+    chunks = plan_dividend_ingest(tickers, chunk_size)
+    total_rows = 0
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=1) as downloader:
+        future = downloader.submit(download_dividends, chunks[0][1], chunks[0][0], end) if chunks else None
+        for done, (start, batch) in enumerate(chunks, start=1):
+            current = future
+            if done < len(chunks):
+                future = downloader.submit(download_dividends, chunks[done][1], chunks[done][0], end)
+            try:
+                rows, returned = current.result()
+                upsert_rows(Dividend, rows, ['ticker', 'ex_date'])
+                now = datetime.now()
+                upsert_rows(DividendCoverage, [{'ticker': ticker, 'end_date': end, 'updated_at': now}
+                                               for ticker in returned if ticker in batch], ['ticker'])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failed.extend(batch)
+                if progress:
+                    progress(f'[{done}/{len(chunks)}] {len(batch)} tickers failed: {e}')
+                continue
+            missing = sorted(set(batch) - set(returned))
+            failed.extend(missing)
+            total_rows += len(rows)
+            if progress:
+                progress(f'[{done}/{len(chunks)}] {len(batch)} tickers: {len(rows)} dividends'
+                         + (f', no data for {len(missing)}' if missing else ''))
+
+    return {
+        'chunks': len(chunks),
+        'rows': total_rows,
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def _holdings(portfolio_ids):
+    # Shares held after each trade date per ticker, plus the trade currency of each ticker
+    rows = db.session.query(Transaction.stock_ticker, Transaction.date, Transaction.transaction_type,
+                            Transaction.stock_quantity, Transaction.currency).filter(
+        Transaction.portfolio_id.in_(portfolio_ids)).all()
+    trades = pd.DataFrame(rows, columns=['ticker', 'date', 'transaction_type', 'quantity', 'currency'])
+    currencies = trades.drop_duplicates('ticker').set_index('ticker')['currency']
+    trades['quantity'] *= trades['transaction_type'].map({'buy': 1.0, 'sell': -1.0}).fillna(0.0)
+    holdings = trades.groupby(['ticker', 'date'], as_index=False)['quantity'].sum().sort_values(['ticker', 'date'])
+    holdings['quantity'] = holdings.groupby('ticker')['quantity'].cumsum()
+    holdings['date'] = pd.to_datetime(holdings['date'])
+    return holdings, currencies
+
+def dividend_income(portfolio_ids, today=None):
+    """(received, expected) dividend income of the portfolios, read from the local dividends table only.
+
+    Received pays every stored dividend on the shares held before its
+    ex-date: one merge_asof of all dividend events against the cumulative
+    holdings. Expected repeats the last twelve months of dividends one
+    year later on the shares held today. Both frames have ticker, ex_date,
+    amount, quantity, income and currency columns.
+    """
+    today = today or date.today()
+    columns = ['ticker', 'ex_date', 'amount', 'quantity', 'income', 'currency']
+    holdings, currencies = _holdings(portfolio_ids)
+    if holdings.empty:
+        return pd.DataFrame(columns=columns), pd.DataFrame(columns=columns)
+
+    rows = db.session.query(Dividend.ticker, Dividend.ex_date, Dividend.amount).filter(
+        Dividend.ticker.in_(list(currencies.index)), Dividend.ex_date <= today).all()
+    dividends = pd.DataFrame(rows, columns=['ticker', 'ex_date', 'amount'])
+    dividends['ex_date'] = pd.to_datetime(dividends['ex_date'])
+
+    # A buy on the ex-date itself does not receive the dividend
+    received = pd.merge_asof(dividends.sort_values('ex_date'), holdings.sort_values('date'),
+                             left_on='ex_date', right_on='date', by='ticker', allow_exact_matches=False)
+    received = received[received['quantity'] > 0].copy()
+    received['income'] = received['amount'] * received['quantity']
+    received['currency'] = received['ticker'].map(currencies)
+
+    current = holdings.groupby('ticker')['quantity'].last()
+    current = current[current > 0]
+    expected = dividends[(dividends['ex_date'] > pd.Timestamp(today) - pd.DateOffset(years=1))
+                         & dividends['ticker'].isin(current.index)].copy()
+    expected['ex_date'] += pd.DateOffset(years=1)
+    expected['quantity'] = expected['ticker'].map(current)
+    expected['income'] = expected['amount'] * expected['quantity']
+    expected['currency'] = expected['ticker'].map(currencies)
+
+    return (received[columns].sort_values('ex_date', ascending=False).reset_index(drop=True),
+            expected[columns].sort_values('ex_date').reset_index(drop=True))
+
+@click.command('ingest-dividends')
+@with_appcontext
+@click.option('--ticker', 'tickers', multiple=True, help='Ticker to ingest (repeatable; default every traded ticker).')
+@click.option('--chunk-size', type=int, default=50, show_default=True, help='Tickers per download and transaction.')
+def ingest_dividends_command(tickers, chunk_size):
+    """Fetch dividend history for the traded tickers into the local dividends table (run nightly)."""
+    tickers = list(tickers) or portfolio_tickers()
+    if not tickers:
+        raise click.ClickException('No tickers given and there are no transactions yet.')
+    summary = ingest_dividends(tickers, chunk_size, progress=click.echo)
+    click.echo(f"Stored {summary['rows']} dividends in {summary['chunks']} chunks in {summary['seconds']} s.")
+    if summary['failed']:
+        click.echo(f"Failed, re-run to retry: {', '.join(summary['failed'])}")
@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+from flask import current_app
+from app.price_store import get_prices
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Rates are stored as the USD value of one unit of a currency
+BASE_CURRENCY = 'USD'
+
+# Days looked back for the last rate before the first requested day (weekends, holidays)
+RATE_LOOKBACK_DAYS = 10
+
+def reporting_currencies():
+    return current_app.config.get('FX_CURRENCIES', ['USD', 'EUR', 'CZK'])
+
+def fx_ticker(currency):
+    """yfinance symbol of the currency's USD rate, e.g. EURUSD=X."""
+    return f'{currency}{BASE_CURRENCY}=X'
+
+def fx_rates(currencies, start, end=None):
+    """USD value of one unit of every currency per calendar day as a (day x currency) frame.
+
+    The daily closes are cached in the price store like any other ticker;
+    weekends and holidays carry the last close forward. A currency without
+    any rate raises ValueError.
+    """
+    end = end or date.today()
+    currencies = sorted({currency.upper() for currency in currencies})
+    calendar = pd.date_range(start, end, name='date')
+    rates = pd.DataFrame(1.0, index=calendar, columns=currencies)
+
+    foreign = [currency for currency in currencies if currency != BASE_CURRENCY]
+    if foreign:
+        lookback = start - timedelta(days=RATE_LOOKBACK_DAYS)
+        closes = get_prices([fx_ticker(currency) for currency in foreign], lookback, end, field='close')
+        closes = closes.reindex(pd.date_range(lookback, end)).ffill().bfill().reindex(calendar)
+        for currency in foreign:
+            ticker = fx_ticker(currency)
+            if ticker not in closes or closes[ticker].isna().all():
+                raise ValueError(f'No exchange rates available for {currency}.')
+            rates[currency] = closes[ticker].to_numpy()
+    return rates
+
+def convert(amounts, currencies, dates, to_currency):
+    """Convert amounts in mixed currencies into `to_currency` at the rate as of each date.
+
+    All rates come from one fx_rates() call and are gathered with a single
+    array lookup, so the number of rows never changes the number of
+    queries or downloads.
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    if not len(amounts):
+        return amounts
+    currencies = pd.Index(currencies).str.upper()
+    days = pd.to_datetime(pd.Index(dates)).normalize()
+    first, last = days.min(), days.max()
+    rates = fx_rates(set(currencies) | {to_currency.upper()}, first.date(), last.date())
+
+    matrix = rates.to_numpy()
+    rows = (days - first).days.to_numpy()
+    columns = rates.columns.get_indexer(currencies)
+    return amounts * matrix[rows, columns] / matrix[rows, rates.columns.get_loc(to_currency.upper())]
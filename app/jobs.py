@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+import time
+import uuid
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.models import Job
+
+PENDING_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('done', 'failed', 'timeout')
+
+_handlers = {}
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of `kind`; it is called with the job params as keyword arguments."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+def job_key(kind, params):
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True, default=str).encode()).hexdigest()
+
+class JobQueue:
+    """Worker pool that runs jobs from the job table.
+
+    Workers are threads of the web process, started on the first submit,
+    or a sidecar process started with `flask run-jobs`. Jobs are claimed
+    with a conditional UPDATE, so any number of workers can share the
+    table. A job that runs past its deadline is marked 'timeout' and its
+    late result is discarded; Python can not stop the thread itself.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.workers = 2
+        self.timeout_seconds = 120
+        self.result_ttl_seconds = 3600
+        self.poll_seconds = 1.0
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._last_reap = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('JOB_WORKERS', self.workers)
+        self.timeout_seconds = app.config.get('JOB_TIMEOUT_SECONDS', self.timeout_seconds)
+        self.result_ttl_seconds = app.config.get('JOB_RESULT_TTL_SECONDS', self.result_ttl_seconds)
+        self.poll_seconds = app.config.get('JOB_POLL_SECONDS', self.poll_seconds)
+
+    def start(self, workers=None):
+        # Threads are only started on demand so CLI commands and forking servers never inherit them
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            missing = (workers or self.workers) - len(self._threads)
+            for _ in range(max(missing, 0)):
+                thread = threading.Thread(target=self._work, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        if self.workers:
+            self.start()
+        self._wakeup.set()
+
+    def _work(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.reap()
+                    job = claim_next_job()
+                    if job is not None:
+                        run_job(job)
+                        continue
+                except Exception:
+                    # e.g. "database is locked"; the worker must outlive it, the next poll retries
+                    self.app.logger.exception('Job worker iteration failed')
+                    db.session.rollback()
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def reap(self, force=False):
+        """Time out jobs past their deadline and delete expired results (at most every few seconds)."""
+        if not force and time.monotonic() - self._last_reap < 5:
+            return
+        self._last_reap = time.monotonic()
+        now = datetime.now()
+        Job.query.filter(Job.status == 'running', Job.deadline < now).update({
+            'status': 'timeout',
+            'error': 'The job did not finish in time.',
+            'finished_at': now,
+            'expires_at': now + timedelta(seconds=self.result_ttl_seconds)
+        }, synchronize_session=False)
+        Job.query.filter(Job.status.in_(FINISHED_STATUSES), Job.expires_at < now).delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        counts = dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+        oldest_queued = db.session.query(db.func.min(Job.created_at)).filter(Job.status == 'queued').scalar()
+        return {
+            'workers': sum(thread.is_alive() for thread in self._threads),
+            'configured_workers': self.workers,
+            'counts': {status: counts.get(status, 0) for status in PENDING_STATUSES + FINISHED_STATUSES},
+            'depth': sum(counts.get(status, 0) for status in PENDING_STATUSES),
+            'oldest_queued_seconds': round((datetime.now() - oldest_queued).total_seconds(), 1) if oldest_queued else None
+        }
+
+job_queue = JobQueue()
+
+def submit_job(kind, params, user_id=None, timeout_seconds=None):
+    """Queue a job, or return the identical job that is still queued or running."""
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    key = job_key(kind, params)
+    now = datetime.now()
+    existing = Job.query.filter(Job.dedup_key == key, Job.kind == kind, Job.status.in_(PENDING_STATUSES)).first()
+    if existing is not None:
+        job_queue.notify()
+        return existing
+
+    job = Job(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params, default=str), dedup_key=key,
+              status='queued', user_id=user_id, timeout_seconds=timeout_seconds or job_queue.timeout_seconds,
+              created_at=now)
+    db.session.add(job)
+    db.session.commit()
+    job_queue.notify()
+    return job
+
+def claim_next_job():
+    # The status check in the UPDATE makes the claim atomic across threads and processes
+    candidates = db.session.query(Job.id, Job.timeout_seconds).filter(Job.status == 'queued').order_by(Job.created_at).limit(5).all()
+    for job_id, timeout_seconds in candidates:
+        now = datetime.now()
+        claimed = Job.query.filter(Job.id == job_id, Job.status == 'queued').update({
+            'status': 'running',
+            'started_at': now,
+            'deadline': now + timedelta(seconds=timeout_seconds)
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+def run_job(job):
+    handler = _handlers.get(job.kind)
+    job_id = job.id
+    try:
+        if handler is None:
+            raise ValueError(f'Unknown job kind: {job.kind}')
+        result = handler(**json.loads(job.params))
+        values = {'status': 'done', 'result': result if isinstance(result, str) else json.dumps(result, default=str)}
+    except Exception as e:
+        db.session.rollback()
+        values = {'status': 'failed', 'error': str(e)}
+    now = datetime.now()
+    values['finished_at'] = now
+    values['expires_at'] = now + timedelta(seconds=job_queue.result_ttl_seconds)
+    # A job that was timed out meanwhile keeps its 'timeout' status
+    Job.query.filter(Job.id == job_id, Job.status == 'running').update(values, synchronize_session=False)
+    db.session.commit()
+
+@click.command('run-jobs')
+@with_appcontext
+@click.option('--workers', type=int, default=None, help='Number of worker threads (default JOB_WORKERS).')
+def run_jobs_command(workers):
+    """Run a job worker pool in the foreground, next to the web processes."""
+    workers = workers or job_queue.workers or 1
+    job_queue.start(workers)
+    click.echo(f'Running {workers} job workers. Press Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,55 @@
+import importlib
+import threading
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access.
+
+    `pd = lazy_import('pandas')` at the top of a module keeps pandas out of
+    worker start-up until a request actually uses it. The import itself
+    goes through importlib, so concurrent first uses are safe.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        return f"<lazy module '{self.__dict__['_name']}'>"
+
+def lazy_import(name):
+    return LazyModule(name)
+
+class LazyPrefixDispatcher:
+    """WSGI middleware that builds a sub-application on the first request under `prefix`.
+
+    Everything else goes straight to the wrapped application, so a heavy
+    sub-application (the Dash board) costs nothing until it is opened.
+    """
+
+    def __init__(self, wsgi_app, prefix, factory):
+        self.wsgi_app = wsgi_app
+        self.prefix = prefix
+        self.factory = factory
+        self._app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith(self.prefix):
+            return self.wsgi_app(environ, start_response)
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._app = self.factory()
+        return self._app(environ, start_response)
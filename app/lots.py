@@ -0,0 +1,144 @@
+from collections import deque, namedtuple
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+MATCHING_METHODS = ('fifo', 'lifo', 'average')
+
+# Quantities below this are treated as fully consumed
+QUANTITY_EPSILON = 1e-9
+
+Trade = namedtuple('Trade', ['id', 'date', 'stock_ticker', 'transaction_type', 'quantity', 'price', 'cost', 'currency'])
+RealizedLot = namedtuple('RealizedLot', ['stock_ticker', 'buy_id', 'sell_id', 'buy_date', 'sell_date', 'quantity',
+                                         'buy_price', 'sell_price', 'profit', 'currency'])
+
+def trades_from_transactions(transactions):
+    """Detached, date-sorted copy of Transaction rows; the ORM objects are only read."""
+    trades = [Trade(t.id, t.date, t.stock_ticker, t.transaction_type, t.stock_quantity, t.stock_price,
+                    t.transaction_cost, t.currency) for t in transactions]
+    trades.sort(key=lambda trade: (trade.date, trade.id))
+    return trades
+
+def match_lots(trades, method='fifo'):
+    """Match sells against earlier buys in a single pass over date-sorted trades.
+
+    Returns (realized, open_lots): realized is a list of RealizedLot, one per
+    (buy lot, sell) pair, and open_lots maps ticker to the remaining lots as
+    [buy_id, buy_date, quantity, unit_price, unit_cost, currency] lists.
+    Transaction costs are split across partial matches by quantity. With the
+    'average' method every ticker holds one pooled lot at the average cost.
+    """
+    if method not in MATCHING_METHODS:
+        raise ValueError(f'Unknown lot matching method: {method}')
+
+    realized = []
+    add_realized = realized.append
+    open_lots = {}
+    lifo = method == 'lifo'
+    average = method == 'average'
+
+    for trade_id, trade_date, stock_ticker, transaction_type, quantity, price, cost, currency in trades:
+        if quantity <= 0:
+            continue
+        lots = open_lots.get(stock_ticker)
+        if lots is None:
+            lots = open_lots[stock_ticker] = deque()
+
+        if transaction_type == 'buy':
+            if average and lots:
+                lot = lots[0]
+                pooled = lot[2] + quantity
+                lot[3] = (lot[3] * lot[2] + price * quantity) / pooled
+                lot[4] = (lot[4] * lot[2] + cost) / pooled
+                lot[2] = pooled
+            else:
+                lots.append([None if average else trade_id, trade_date, quantity, price, cost / quantity, currency])
+            continue
+
+        if transaction_type != 'sell':
+            continue
+
+        remaining = quantity
+        sell_unit_cost = cost / quantity
+        while remaining > QUANTITY_EPSILON and lots:
+            lot = lots[-1] if lifo else lots[0]
+            matched = lot[2] if lot[2] < remaining else remaining
+            add_realized(RealizedLot(stock_ticker, lot[0], trade_id, lot[1], trade_date, matched, lot[3], price,
+                                     (price - lot[3] - lot[4] - sell_unit_cost) * matched, lot[5]))
+            lot[2] -= matched
+            remaining -= matched
+            if lot[2] <= QUANTITY_EPSILON:
+                if lifo:
+                    lots.pop()
+                else:
+                    lots.popleft()
+
+    return realized, {ticker: list(lots) for ticker, lots in open_lots.items() if lots}
+
+class TaxLotIndex:
+    """FIFO tax lots of one (portfolio, ticker) as date-sorted arrays with running quantities.
+
+    Buys are kept in acquisition order with their cumulative quantity and
+    sells with the cumulative quantity sold. Under FIFO the first
+    `sold` shares of that running total are gone, so every question about
+    a date or a quantity is a binary search instead of a walk over the
+    lots, which keeps accounts with thousands of small DCA buys fast.
+    Assumes a position is never sold short.
+    """
+
+    def __init__(self, trades):
+        buys = [t for t in trades if t.transaction_type == 'buy' and t.quantity > 0]
+        sells = [t for t in trades if t.transaction_type == 'sell' and t.quantity > 0]
+        self.buys = buys
+        self.sells = sells
+        self.buy_dates = np.array([t.date for t in buys], dtype='datetime64[D]')
+        self.sell_dates = np.array([t.date for t in sells], dtype='datetime64[D]')
+        self.bought = np.cumsum([t.quantity for t in buys], dtype=float)
+        self.sold = np.cumsum([t.quantity for t in sells], dtype=float)
+
+    def _bought_before(self, count):
+        return self.bought[count - 1] if count > 0 else 0.0
+
+    def sold_through(self, as_of):
+        """Quantity sold on or before `as_of`."""
+        count = np.searchsorted(self.sell_dates, np.datetime64(as_of, 'D'), side='right')
+        return self.sold[count - 1] if count > 0 else 0.0
+
+    def open_quantity(self, as_of):
+        count = np.searchsorted(self.buy_dates, np.datetime64(as_of, 'D'), side='right')
+        return float(max(self._bought_before(count) - self.sold_through(as_of), 0.0))
+
+    def tax_free_quantity(self, as_of, years=3):
+        """Open quantity on `as_of` that has been held for more than `years` years."""
+        cutoff = (pd.Timestamp(as_of) - pd.DateOffset(years=years)).to_datetime64().astype('datetime64[D]')
+        count = np.searchsorted(self.buy_dates, cutoff, side='left')
+        return float(max(self._bought_before(count) - self.sold_through(as_of), 0.0))
+
+    def consumed_lots(self, quantity, as_of):
+        """The lots a sell of `quantity` on `as_of` would take, as [(buy trade, quantity)] oldest first."""
+        start = self.sold_through(as_of)
+        end = min(start + quantity, self._bought_before(
+            np.searchsorted(self.buy_dates, np.datetime64(as_of, 'D'), side='right')))
+        first = np.searchsorted(self.bought, start, side='right')
+        last = np.searchsorted(self.bought, end - QUANTITY_EPSILON, side='right')
+        consumed = []
+        for i in range(first, min(last + 1, len(self.buys))):
+            taken = min(self.bought[i], end) - max(self._bought_before(i), start)
+            if taken > QUANTITY_EPSILON:
+                consumed.append((self.buys[i], float(taken)))
+        return consumed
+
+    def matches(self):
+        """Every (buy index, sell index, quantity) FIFO match, from one merge of the two running totals."""
+        if not len(self.bought) or not len(self.sold):
+            return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+        limit = min(self.bought[-1], self.sold[-1])
+        points = np.union1d(np.concatenate(([0.0], self.bought)), np.concatenate(([0.0], self.sold)))
+        points = np.append(points[points < limit], limit)
+        starts, quantities = points[:-1], np.diff(points)
+        keep = quantities > QUANTITY_EPSILON
+        starts, quantities = starts[keep], quantities[keep]
+        # The segment starting at `s` belongs to the first buy and the first sell whose running total exceeds it
+        return (np.searchsorted(self.bought, starts, side='right'),
+                np.searchsorted(self.sold, starts, side='right'),
+                quantities)
@@ -0,0 +1,79 @@
+from datetime import datetime
+import json
+import os
+import shutil
+import threading
+from flask import current_app
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+
+CURRENT_FILE = 'CURRENT'
+INDEX_FILE = 'index.json'
+
+def snapshot_root(name):
+    """Directory holding the snapshots called `name` (SNAPSHOT_DIR, or the instance folder)."""
+    root = current_app.config.get('SNAPSHOT_DIR') or os.path.join(current_app.instance_path, 'snapshots')
+    return os.path.join(root, name)
+
+def write_snapshot(directory, arrays, index, keep=2):
+    """Write arrays as .npy files into a new version directory and switch CURRENT to it atomically.
+
+    Readers that still have the previous version mapped keep working: it is
+    only deleted once `keep` newer versions exist.
+    """
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        target = np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+',
+                                           dtype=array.dtype, shape=array.shape)
+        target[...] = array
+        target.flush()
+        del target
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    pointer = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(pointer, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    versions = sorted(entry for entry in os.listdir(directory)
+                      if entry != version and os.path.isdir(os.path.join(directory, entry)))
+    for old in versions[:max(len(versions) - keep + 1, 0)]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version
+
+class Snapshot:
+    """An opened snapshot version: its index dict plus read-only memory-mapped arrays."""
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self._arrays = {}
+
+    def array(self, name):
+        # np.load maps the file, so every worker shares the OS page cache instead of holding a copy
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+        return self._arrays[name]
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def open_snapshot(directory):
+    """The current snapshot in `directory`, or None if none has been written yet. Reopened when CURRENT changes."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    with _snapshots_lock:
+        snapshot = _snapshots.get(directory)
+        if snapshot is None or snapshot.version != version:
+            snapshot = _snapshots[directory] = Snapshot(os.path.join(directory, version), version)
+        return snapshot
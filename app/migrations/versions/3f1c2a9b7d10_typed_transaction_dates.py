@@ -0,0 +1,55 @@
+"""typed transaction dates and composite indexes
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_transaction_portfolio_date': ['portfolio_id', 'date'],
+    'ix_transaction_user_ticker_date': ['user_id', 'stock_ticker', 'date'],
+}
+
+
+def upgrade():
+    # create_app() may already have created the table with the new schema, so check before altering
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    date_column = next(c for c in inspector.get_columns('transaction') if c['name'] == 'date')
+    existing_indexes = {index['name'] for index in inspector.get_indexes('transaction')}
+
+    if not isinstance(date_column['type'], sa.Date):
+        if bind.dialect.name == 'sqlite':
+            # A batch ALTER would CAST('2024-03-01' AS DATE), which SQLite turns into 2024,
+            # so copy the ISO strings into a new column and swap it in instead
+            op.add_column('transaction', sa.Column('date_typed', sa.Date(), nullable=True))
+            op.execute('UPDATE "transaction" SET date_typed = date')
+            with op.batch_alter_table('transaction') as batch_op:
+                batch_op.drop_column('date')
+                batch_op.alter_column('date_typed', new_column_name='date', existing_type=sa.Date(), nullable=False)
+        else:
+            op.alter_column('transaction', 'date', existing_type=sa.String(length=10), type_=sa.Date(),
+                            existing_nullable=False, postgresql_using='date::date')
+
+    with op.batch_alter_table('transaction') as batch_op:
+        for name, columns in INDEXES.items():
+            if name not in existing_indexes:
+                batch_op.create_index(name, columns, unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction') as batch_op:
+        for name in INDEXES:
+            batch_op.drop_index(name)
+        batch_op.alter_column('date', existing_type=sa.Date(), type_=sa.String(length=10),
+                              existing_nullable=False, postgresql_using="to_char(date, 'YYYY-MM-DD')")
@@ -0,0 +1,46 @@
+"""local price store tables
+
+Revision ID: 8a41c6e2d3b5
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41c6e2d3b5'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'historical_prices' not in existing_tables:
+        op.create_table(
+            'historical_prices',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('ticker', sa.String(length=10), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('close', sa.Float(), nullable=True),
+            sa.Column('adj_close', sa.Float(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('ticker', 'date', name='uq_historical_prices_ticker_date'),
+        )
+    if 'price_coverage' not in existing_tables:
+        op.create_table(
+            'price_coverage',
+            sa.Column('ticker', sa.String(length=10), nullable=False),
+            sa.Column('start_date', sa.Date(), nullable=False),
+            sa.Column('end_date', sa.Date(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('ticker'),
+        )
+
+
+def downgrade():
+    op.drop_table('price_coverage')
+    op.drop_table('historical_prices')
@@ -0,0 +1,42 @@
+"""positions ledger
+
+Revision ID: b2e7f90c4a18
+Revises: 8a41c6e2d3b5
+Create Date: 2026-10-18 15:01:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e7f90c4a18'
+down_revision = '8a41c6e2d3b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'position' not in existing_tables:
+        op.create_table(
+            'position',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('portfolio_id', sa.Integer(), nullable=False),
+            sa.Column('stock_ticker', sa.String(length=10), nullable=False),
+            sa.Column('quantity', sa.Float(), nullable=False),
+            sa.Column('total_cost', sa.Float(), nullable=False),
+            sa.Column('avg_price', sa.Float(), nullable=False),
+            sa.Column('currency', sa.String(length=10), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('portfolio_id', 'stock_ticker', name='uq_position_portfolio_ticker'),
+        )
+        op.create_index('ix_position_user_id', 'position', ['user_id'])
+
+
+def downgrade():
+    op.drop_table('position')
@@ -0,0 +1,47 @@
+"""background job queue
+
+Revision ID: c5d3a1e8f267
+Revises: b2e7f90c4a18
+Create Date: 2026-10-18 15:02:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d3a1e8f267'
+down_revision = 'b2e7f90c4a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'job' not in existing_tables:
+        op.create_table(
+            'job',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('kind', sa.String(length=50), nullable=False),
+            sa.Column('params', sa.Text(), nullable=False),
+            sa.Column('dedup_key', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('timeout_seconds', sa.Integer(), nullable=False),
+            sa.Column('result', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('deadline', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_job_dedup_key', 'job', ['dedup_key'])
+        op.create_index('ix_job_status_created', 'job', ['status', 'created_at'])
+
+
+def downgrade():
+    op.drop_table('job')
@@ -0,0 +1,37 @@
+"""sp500 membership changes
+
+Revision ID: d9f04b7e1c32
+Revises: c5d3a1e8f267
+Create Date: 2026-10-18 15:03:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f04b7e1c32'
+down_revision = 'c5d3a1e8f267'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'sp500_membership_changes' not in existing_tables:
+        op.create_table(
+            'sp500_membership_changes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('ticker', sa.String(length=10), nullable=False),
+            sa.Column('company_name', sa.String(length=100), nullable=False),
+            sa.Column('change', sa.String(length=10), nullable=False),
+            sa.Column('effective_date', sa.Date(), nullable=False),
+            sa.Column('recorded_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_sp500_membership_changes_ticker', 'sp500_membership_changes', ['ticker'])
+
+
+def downgrade():
+    op.drop_table('sp500_membership_changes')
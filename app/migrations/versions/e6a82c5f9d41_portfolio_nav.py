@@ -0,0 +1,54 @@
+"""portfolio nav series
+
+Revision ID: e6a82c5f9d41
+Revises: d9f04b7e1c32
+Create Date: 2026-10-18 15:04:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a82c5f9d41'
+down_revision = 'd9f04b7e1c32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'portfolio_nav' not in existing_tables:
+        op.create_table(
+            'portfolio_nav',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('portfolio_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('value', sa.Float(), nullable=False),
+            sa.Column('inflow', sa.Float(), nullable=False),
+            sa.Column('outflow', sa.Float(), nullable=False),
+            sa.Column('daily_return', sa.Float(), nullable=False),
+            sa.Column('twr_index', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('portfolio_id', 'date', name='uq_portfolio_nav_portfolio_date'),
+        )
+    if 'portfolio_nav_state' not in existing_tables:
+        op.create_table(
+            'portfolio_nav_state',
+            sa.Column('portfolio_id', sa.Integer(), nullable=False),
+            sa.Column('last_date', sa.Date(), nullable=False),
+            sa.Column('last_value', sa.Float(), nullable=False),
+            sa.Column('last_twr_index', sa.Float(), nullable=False),
+            sa.Column('last_transaction_id', sa.Integer(), nullable=False),
+            sa.Column('holdings', sa.Text(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.id']),
+            sa.PrimaryKeyConstraint('portfolio_id'),
+        )
+
+
+def downgrade():
+    op.drop_table('portfolio_nav_state')
+    op.drop_table('portfolio_nav')
@@ -0,0 +1,44 @@
+"""dividend store
+
+Revision ID: f17b3d6a8e59
+Revises: e6a82c5f9d41
+Create Date: 2026-10-18 15:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f17b3d6a8e59'
+down_revision = 'e6a82c5f9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before this revision got the table(s) from db.create_all() at startup
+    existing_tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'dividends' not in existing_tables:
+        op.create_table(
+            'dividends',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('ticker', sa.String(length=10), nullable=False),
+            sa.Column('ex_date', sa.Date(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('ticker', 'ex_date', name='uq_dividends_ticker_ex_date'),
+        )
+    if 'dividend_coverage' not in existing_tables:
+        op.create_table(
+            'dividend_coverage',
+            sa.Column('ticker', sa.String(length=10), nullable=False),
+            sa.Column('end_date', sa.Date(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('ticker'),
+        )
+
+
+def downgrade():
+    op.drop_table('dividend_coverage')
+    op.drop_table('dividends')
@@ -16,7 +16,7 @@ class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolio.id'), nullable=False)
-    date = db.Column(db.String(10), nullable=False)
+    date = db.Column(db.Date, nullable=False)
     stock_ticker = db.Column(db.String(10), nullable=False)
     stock_price = db.Column(db.Float, nullable=False)
     transaction_type = db.Column(db.String(10), nullable=False)
@@ -24,11 +24,25 @@ class Transaction(db.Model):
     stock_quantity = db.Column(db.Float, nullable=False)
     total_transaction_cost = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(10), nullable=False)
+    __table_args__ = (
+        db.Index('ix_transaction_portfolio_date', 'portfolio_id', 'date'),
+        db.Index('ix_transaction_user_ticker_date', 'user_id', 'stock_ticker', 'date'),
+    )
 
 class SP500Ticker(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ticker = db.Column(db.String(10), unique=True, nullable=False)
     company_name = db.Column(db.String(100), nullable=False)
+
+class SP500MembershipChange(db.Model):
+    # Constituents that joined or left the index, as seen by each refresh
+    __tablename__ = 'sp500_membership_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(10), nullable=False, index=True)
+    company_name = db.Column(db.String(100), nullable=False)
+    change = db.Column(db.String(10), nullable=False)  # 'added' or 'removed'
+    effective_date = db.Column(db.Date, nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False)
     
 class Todo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,3 +53,90 @@ class Todo(db.Model):
     creation_date = db.Column(db.DateTime, nullable=False)
     done_date = db.Column(db.DateTime, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+class HistoricalPrice(db.Model):
+    __tablename__ = 'historical_prices'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(10), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    close = db.Column(db.Float, nullable=True)
+    adj_close = db.Column(db.Float, nullable=True)
+    __table_args__ = (db.UniqueConstraint('ticker', 'date', name='uq_historical_prices_ticker_date'),)
+
+class PriceCoverage(db.Model):
+    # Date range already fetched into historical_prices for each ticker
+    __tablename__ = 'price_coverage'
+    ticker = db.Column(db.String(10), primary_key=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class Position(db.Model):
+    # Running totals per (portfolio, ticker), kept in sync with Transaction on every write
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolio.id'), nullable=False)
+    stock_ticker = db.Column(db.String(10), nullable=False)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    avg_price = db.Column(db.Float, nullable=False, default=0)
+    currency = db.Column(db.String(10), nullable=False)
+    __table_args__ = (db.UniqueConstraint('portfolio_id', 'stock_ticker', name='uq_position_portfolio_ticker'),)
+
+class Job(db.Model):
+    # Background analytics job; the table is the queue, so no external broker is needed
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False)
+    dedup_key = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    timeout_seconds = db.Column(db.Integer, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    deadline = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.Index('ix_job_status_created', 'status', 'created_at'),)
+
+class PortfolioNav(db.Model):
+    # Daily portfolio value (in USD) and time-weighted return index, appended by app/nav.py
+    __tablename__ = 'portfolio_nav'
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolio.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    inflow = db.Column(db.Float, nullable=False, default=0)
+    outflow = db.Column(db.Float, nullable=False, default=0)
+    daily_return = db.Column(db.Float, nullable=False, default=0)
+    twr_index = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('portfolio_id', 'date', name='uq_portfolio_nav_portfolio_date'),)
+
+class PortfolioNavState(db.Model):
+    # Holdings after the last stored NAV day, so the next day is appended without replaying history
+    __tablename__ = 'portfolio_nav_state'
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolio.id'), primary_key=True)
+    last_date = db.Column(db.Date, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    last_twr_index = db.Column(db.Float, nullable=False)
+    last_transaction_id = db.Column(db.Integer, nullable=False)
+    holdings = db.Column(db.Text, nullable=False)  # JSON {ticker: [quantity, currency]}
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class Dividend(db.Model):
+    # Cash dividend per share by ex-dividend date, filled by app/dividends.py
+    __tablename__ = 'dividends'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(10), nullable=False)
+    ex_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('ticker', 'ex_date', name='uq_dividends_ticker_ex_date'),)
+
+class DividendCoverage(db.Model):
+    # Date through which dividends have been fetched for each ticker
+    __tablename__ = 'dividend_coverage'
+    ticker = db.Column(db.String(10), primary_key=True)
+    end_date = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
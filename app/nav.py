@@ -0,0 +1,198 @@
+from datetime import date, datetime, timedelta
+import json
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.fx import fx_rates
+from app.models import Portfolio, PortfolioNav, PortfolioNavState, Transaction
+from app.price_store import get_prices
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Days looked back for the last close before the first computed day
+PRICE_LOOKBACK_DAYS = 10
+
+PERFORMANCE_PERIODS = {
+    'daily': None,
+    'weekly': 'W-FRI',
+    'monthly': 'ME',
+    'yearly': 'YE'
+}
+
+TRADE_COLUMNS = ['id', 'date', 'ticker', 'transaction_type', 'quantity', 'total_cost', 'currency']
+NAV_COLUMNS = ['date', 'value', 'inflow', 'outflow', 'daily_return', 'twr_index']
+
+def _trades(portfolio_id, after=None):
+    query = db.session.query(Transaction.id, Transaction.date, Transaction.stock_ticker, Transaction.transaction_type,
+                             Transaction.stock_quantity, Transaction.total_transaction_cost,
+                             Transaction.currency).filter(Transaction.portfolio_id == portfolio_id)
+    if after is not None:
+        query = query.filter(Transaction.date > after)
+    trades = pd.DataFrame(query.all(), columns=TRADE_COLUMNS)
+    trades['sign'] = trades['transaction_type'].map({'buy': 1.0, 'sell': -1.0}).fillna(0.0)
+    return trades
+
+def compute_nav(trades, start, end, holdings=None, value=0.0, twr_index=1.0):
+    """Daily NAV rows from `start` to `end` starting from the given holdings, plus the holdings at the end.
+
+    Trades are bucketed onto trading days (a weekend trade counts on the
+    next trading day), holdings are the cumulative sum of the daily
+    quantity deltas and the value is holdings x closes x USD rates, all
+    as (days x tickers) arrays. Buys count as inflows at the start of the
+    day and sells as outflows at its end, so the daily time-weighted
+    return is (value + outflow) / (previous value + inflow) - 1.
+    """
+    holdings = dict(holdings or {})
+    # Currencies come from a free-text field; fx_rates columns are upper-case codes
+    currencies = {ticker: currency.strip().upper() for ticker, (_, currency) in holdings.items()}
+    for ticker, currency in zip(trades['ticker'], trades['currency']):
+        currencies.setdefault(ticker, currency.strip().upper())
+    tickers = sorted(currencies)
+    if not tickers:
+        return pd.DataFrame(columns=NAV_COLUMNS), holdings
+
+    closes = get_prices(tickers, start - timedelta(days=PRICE_LOOKBACK_DAYS), end, field='close')
+    if closes.empty:
+        return pd.DataFrame(columns=NAV_COLUMNS), holdings
+    closes = closes.reindex(columns=tickers).ffill()
+    calendar = closes.index[(closes.index >= pd.Timestamp(start)) & (closes.index <= pd.Timestamp(end))]
+    if not len(calendar):
+        return pd.DataFrame(columns=NAV_COLUMNS), holdings
+    # Trades after the last trading day wait for the next append
+    day_positions = np.searchsorted(calendar, pd.to_datetime(trades['date']))
+    trades = trades[day_positions < len(calendar)]
+    day_positions = day_positions[day_positions < len(calendar)]
+
+    ticker_positions = pd.Index(tickers).get_indexer(trades['ticker'])
+    deltas = np.zeros((len(calendar), len(tickers)))
+    np.add.at(deltas, (day_positions, ticker_positions), trades['sign'].to_numpy() * trades['quantity'].to_numpy())
+    quantities = np.array([holdings.get(ticker, (0.0, None))[0] for ticker in tickers]) + np.cumsum(deltas, axis=0)
+
+    rates = fx_rates(set(currencies.values()), calendar[0].date(), calendar[-1].date())
+    rates = rates.reindex(calendar)[[currencies[ticker] for ticker in tickers]].to_numpy()
+    prices = np.nan_to_num(closes.loc[calendar].to_numpy(dtype=float))
+    values = (quantities * prices * rates).sum(axis=1)
+
+    flows = trades['total_cost'].to_numpy() * rates[day_positions, ticker_positions]
+    inflow = np.zeros(len(calendar))
+    outflow = np.zeros(len(calendar))
+    buys = trades['sign'].to_numpy() > 0
+    sells = trades['sign'].to_numpy() < 0
+    np.add.at(inflow, day_positions[buys], flows[buys])
+    np.add.at(outflow, day_positions[sells], flows[sells])
+
+    previous = np.concatenate([[value], values[:-1]]) + inflow
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.where(previous > 0, (values + outflow) / previous - 1, 0.0)
+    nav = pd.DataFrame({
+        'date': calendar.date,
+        'value': values,
+        'inflow': inflow,
+        'outflow': outflow,
+        'daily_return': returns,
+        'twr_index': twr_index * np.cumprod(1 + returns)
+    })
+    holdings = {ticker: (float(quantity), currencies[ticker]) for ticker, quantity in zip(tickers, quantities[-1])
+                if abs(quantity) > 1e-9}
+    return nav, holdings
+
+def update_nav(portfolio_id, rebuild=False, end=None):
+    """Append the NAV days since the last update, or rebuild the whole series.
+
+    Appending starts from the stored holdings, so a new day costs one price
+    row per held ticker. A transaction added with a date the series has
+    already passed triggers a rebuild. Only finished days (up to yesterday)
+    are stored. Returns the number of days written.
+    """
+    end = end or date.today() - timedelta(days=1)
+    state = db.session.get(PortfolioNavState, portfolio_id)
+    if state is not None and not rebuild:
+        rebuild = db.session.query(Transaction.id).filter(
+            Transaction.portfolio_id == portfolio_id,
+            Transaction.id > state.last_transaction_id,
+            Transaction.date <= state.last_date
+        ).first() is not None
+
+    if state is None or rebuild:
+        PortfolioNav.query.filter_by(portfolio_id=portfolio_id).delete(synchronize_session=False)
+        if state is not None:
+            db.session.delete(state)
+            db.session.flush()
+            state = None
+        trades = _trades(portfolio_id)
+        if trades.empty:
+            db.session.commit()
+            return 0
+        start, holdings, value, twr_index = trades['date'].min(), {}, 0.0, 1.0
+    else:
+        trades = _trades(portfolio_id, after=state.last_date)
+        start = state.last_date + timedelta(days=1)
+        holdings = {ticker: tuple(entry) for ticker, entry in json.loads(state.holdings).items()}
+        value, twr_index = state.last_value, state.last_twr_index
+
+    if start > end:
+        db.session.commit()
+        return 0
+    nav, holdings = compute_nav(trades, start, end, holdings, value, twr_index)
+    if nav.empty:
+        db.session.commit()
+        return 0
+
+    db.session.execute(db.insert(PortfolioNav), [
+        dict(row, portfolio_id=portfolio_id) for row in nav.to_dict('records')
+    ])
+    last = nav.iloc[-1]
+    last_transaction_id = db.session.query(db.func.max(Transaction.id)).filter(
+        Transaction.portfolio_id == portfolio_id, Transaction.date <= last['date']).scalar() or 0
+    if state is None:
+        state = PortfolioNavState(portfolio_id=portfolio_id)
+        db.session.add(state)
+    state.last_date = last['date']
+    state.last_value = float(last['value'])
+    state.last_twr_index = float(last['twr_index'])
+    state.last_transaction_id = last_transaction_id
+    state.holdings = json.dumps(holdings)
+    state.updated_at = datetime.now()
+    db.session.commit()
+    return len(nav)
+
+def nav_series(portfolio_id):
+    """The stored NAV series of a portfolio as a date-indexed DataFrame."""
+    rows = db.session.query(PortfolioNav.date, PortfolioNav.value, PortfolioNav.inflow, PortfolioNav.outflow,
+                            PortfolioNav.daily_return, PortfolioNav.twr_index).filter(
+        PortfolioNav.portfolio_id == portfolio_id).order_by(PortfolioNav.date).all()
+    nav = pd.DataFrame(rows, columns=NAV_COLUMNS)
+    nav['date'] = pd.to_datetime(nav['date'])
+    return nav.set_index('date')
+
+def period_performance(portfolio_id, period='monthly'):
+    """Value, flows and time-weighted return per period, resampled from the stored series."""
+    nav = nav_series(portfolio_id)
+    rule = PERFORMANCE_PERIODS[period]
+    if rule is not None and not nav.empty:
+        nav = nav.resample(rule).agg({'value': 'last', 'inflow': 'sum', 'outflow': 'sum',
+                                      'twr_index': 'last'}).dropna(subset=['twr_index'])
+    nav['period_return'] = nav['twr_index'] / nav['twr_index'].shift(1, fill_value=1.0) - 1
+    return nav[['value', 'inflow', 'outflow', 'period_return', 'twr_index']]
+
+@click.command('update-nav')
+@with_appcontext
+@click.option('--portfolio-id', 'portfolio_ids', type=int, multiple=True, help='Only update these portfolios.')
+@click.option('--rebuild', is_flag=True, help='Recompute the whole history instead of appending.')
+def update_nav_command(portfolio_ids, rebuild):
+    """Append the latest trading days to every portfolio's NAV series (run nightly)."""
+    portfolio_ids = portfolio_ids or [portfolio_id for (portfolio_id,) in db.session.query(Portfolio.id)]
+    failed = []
+    for portfolio_id in portfolio_ids:
+        # One broken portfolio must not stop the nightly run for the others
+        try:
+            days = update_nav(portfolio_id, rebuild=rebuild)
+        except Exception as e:
+            db.session.rollback()
+            failed.append(str(portfolio_id))
+            click.echo(f'Portfolio {portfolio_id}: failed: {e}')
+            continue
+        click.echo(f'Portfolio {portfolio_id}: {days} days written.')
+    if failed:
+        click.echo(f"Failed, re-run to retry: {', '.join(failed)}")
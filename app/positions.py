@@ -0,0 +1,84 @@
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.models import Position, Transaction
+
+def _signed(transaction_type, value):
+    if transaction_type == 'buy':
+        return value
+    if transaction_type == 'sell':
+        return -value
+    return 0
+
+def apply_transaction(transaction, sign=1):
+    """Add a transaction to its position row (sign=-1 takes it back out).
+
+    Only stages the change; the caller commits it together with the
+    transaction itself.
+    """
+    position = Position.query.filter_by(portfolio_id=transaction.portfolio_id,
+                                        stock_ticker=transaction.stock_ticker).first()
+    if position is None:
+        position = Position(user_id=transaction.user_id, portfolio_id=transaction.portfolio_id,
+                            stock_ticker=transaction.stock_ticker, quantity=0, total_cost=0, avg_price=0,
+                            currency=transaction.currency)
+        db.session.add(position)
+
+    position.quantity += sign * _signed(transaction.transaction_type, transaction.stock_quantity)
+    position.total_cost += sign * _signed(transaction.transaction_type, transaction.total_transaction_cost)
+    position.avg_price = position.total_cost / position.quantity if position.quantity != 0 else 0
+    return position
+
+def revert_transaction(transaction):
+    # Use before deleting a transaction, or before editing it and applying it again
+    return apply_transaction(transaction, sign=-1)
+
+def rebuild_positions(portfolio_ids=None):
+    """Recompute position rows from the full transaction history to repair drift."""
+    positions = {}
+    query = db.session.query(Transaction.user_id, Transaction.portfolio_id, Transaction.stock_ticker,
+                             Transaction.transaction_type, Transaction.stock_quantity,
+                             Transaction.total_transaction_cost, Transaction.currency)
+    if portfolio_ids is not None:
+        query = query.filter(Transaction.portfolio_id.in_(portfolio_ids))
+
+    for user_id, portfolio_id, stock_ticker, transaction_type, quantity, total_cost, currency in query.order_by(Transaction.id).yield_per(1000):
+        key = (portfolio_id, stock_ticker)
+        if key not in positions:
+            positions[key] = {'user_id': user_id, 'portfolio_id': portfolio_id, 'stock_ticker': stock_ticker,
+                              'quantity': 0, 'total_cost': 0, 'avg_price': 0, 'currency': currency}
+        position = positions[key]
+        position['quantity'] += _signed(transaction_type, quantity)
+        position['total_cost'] += _signed(transaction_type, total_cost)
+
+    for position in positions.values():
+        position['avg_price'] = position['total_cost'] / position['quantity'] if position['quantity'] != 0 else 0
+
+    delete = Position.query
+    if portfolio_ids is not None:
+        delete = delete.filter(Position.portfolio_id.in_(portfolio_ids))
+    delete.delete(synchronize_session=False)
+    if positions:
+        db.session.execute(db.insert(Position), list(positions.values()))
+    db.session.commit()
+    return len(positions)
+
+def get_positions(portfolio_ids):
+    """Positions summed per ticker over the given portfolios as {ticker: [quantity, total_cost, avg_price, currency]}."""
+    positions_dict = {}
+    for position in Position.query.filter(Position.portfolio_id.in_(portfolio_ids)).order_by(Position.id).all():
+        if position.stock_ticker not in positions_dict:
+            positions_dict[position.stock_ticker] = [0, 0, 0, position.currency]
+        entry = positions_dict[position.stock_ticker]
+        entry[0] += position.quantity
+        entry[1] += position.total_cost
+        entry[2] = entry[1] / entry[0] if entry[0] != 0 else 0
+    return positions_dict
+
+@click.command('rebuild-positions')
+@with_appcontext
+@click.option('--portfolio-id', 'portfolio_ids', type=int, multiple=True, help='Only rebuild these portfolios.')
+def rebuild_positions_command(portfolio_ids):
+    """Rebuild the positions table from the transaction history."""
+    count = rebuild_positions(list(portfolio_ids) or None)
+    click.echo(f'Rebuilt {count} positions.')
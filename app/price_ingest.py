@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.price_store import bar_rows, download_daily_bars, missing_ranges, update_coverage, upsert_bars
+from app.sp500 import sp500_symbols
+
+def plan_ingest(tickers, start=None, end=None, chunk_size=50):
+    """Group tickers into (fetch_start, fetch_end, tickers) download chunks.
+
+    PriceCoverage is the per-ticker checkpoint: only dates after the last
+    stored bar (plus that bar, if it was still trading when fetched) and
+    any missing history before the first one are planned.
+    """
+    pending = missing_ranges(tickers, start, end)
+    return [(fetch_start, fetch_end, batch[i:i + chunk_size])
+            for (fetch_start, fetch_end), batch in sorted(pending.items())
+            for i in range(0, len(batch), chunk_size)]
+
+def ingest_prices(tickers, start=None, end=None, chunk_size=50, progress=None):
+    """Download missing daily bars one chunk at a time and upsert them chunk by chunk.
+
+    yf.download keeps its results in module-global state, so downloads are
+    never run concurrently. A single background thread fetches the next
+    chunk while the calling thread writes the previous one, one transaction
+    per chunk together with its checkpoint, so an interrupted run resumes
+    where it stopped. Only tickers that returned bars are checkpointed; the
+    rest are reported as failed and retried by the next run. Returns a
+    summary with rows/sec.
+    """
+    started = time.perf_counter()
+    chunks = plan_ingest(tickers, start, end, chunk_size)
+    total_rows = 0
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=1) as downloader:
+        future = downloader.submit(download_daily_bars, *_download_args(chunks[0])) if chunks else None
+        for done, (fetch_start, fetch_end, batch) in enumerate(chunks, start=1):
+            current = future
+            if done < len(chunks):
+                future = downloader.submit(download_daily_bars, *_download_args(chunks[done]))
+            try:
+                rows = bar_rows(current.result())
+                returned = sorted({row['ticker'] for row in rows} & set(batch))
+                upsert_bars(rows)
+                if returned:
+                    update_coverage(returned, fetch_start, fetch_end, datetime.now())
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failed.extend(batch)
+                if progress:
+                    progress(f'[{done}/{len(chunks)}] {len(batch)} tickers failed: {e}')
+                continue
+            missing = sorted(set(batch) - set(returned))
+            failed.extend(missing)
+            total_rows += len(rows)
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress(f'[{done}/{len(chunks)}] {len(batch)} tickers {fetch_start} - {fetch_end}: '
+                         f'{len(rows)} rows ({total_rows / elapsed:.0f} rows/s)'
+                         + (f', no data for {len(missing)}' if missing else ''))
+
+    elapsed = time.perf_counter() - started
+    return {
+        'chunks': len(chunks),
+        'rows': total_rows,
+        'failed': failed,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(total_rows / elapsed, 1) if elapsed else None
+    }
+
+def _download_args(chunk):
+    fetch_start, fetch_end, batch = chunk
+    return batch, fetch_start, fetch_end
+
+@click.command('ingest-prices')
+@with_appcontext
+@click.option('--ticker', 'tickers', multiple=True, help='Ticker to ingest (repeatable; default all S&P 500 constituents).')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First date (default 2000-01-01).')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Last date (default today).')
+@click.option('--chunk-size', type=int, default=50, show_default=True, help='Tickers per download and transaction.')
+def ingest_prices_command(tickers, start, end, chunk_size):
+    """Backfill or update daily bars in the local price store; safe to interrupt and re-run."""
+    tickers = list(tickers) or sp500_symbols()
+    if not tickers:
+        raise click.ClickException('No tickers given and the S&P 500 ticker list is empty.')
+    summary = ingest_prices(tickers, start, end, chunk_size, progress=click.echo)
+    click.echo(f"Stored {summary['rows']} rows in {summary['chunks']} chunks in {summary['seconds']} s "
+               f"({summary['rows_per_second']} rows/s).")
+    if summary['failed']:
+        click.echo(f"Failed, re-run to retry: {', '.join(summary['failed'])}")
@@ -0,0 +1,128 @@
+from datetime import date, datetime
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.matrix_store import open_snapshot, snapshot_root, write_snapshot
+from app.models import HistoricalPrice, PriceCoverage
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+SNAPSHOT_NAME = 'prices'
+SNAPSHOT_FIELDS = ('close', 'adj_close')
+
+def build_price_snapshot(tickers=None, chunk_size=50):
+    """Write every stored bar as dense date x ticker float64 matrices (one per field) with date and ticker indexes.
+
+    Rows are read per ticker chunk straight into the matrices, so memory
+    stays at the size of the snapshot itself. Values stay float64 like the
+    Float columns, so reads match the SQL path exactly. The index records
+    the build time and every ticker's PriceCoverage range, read before the
+    bars, so readers can tell which tickers were written to after the build.
+    """
+    built_at = datetime.now()
+    if tickers is None:
+        tickers = [ticker for (ticker,) in db.session.query(HistoricalPrice.ticker).distinct()]
+    tickers = sorted(set(tickers))
+    dates = np.array(sorted(day for (day,) in db.session.query(HistoricalPrice.date).filter(
+        HistoricalPrice.ticker.in_(tickers)).distinct()), dtype='datetime64[D]')
+    if not tickers or not len(dates):
+        raise click.ClickException('There are no stored prices to snapshot.')
+
+    coverage = {c.ticker: [c.start_date.isoformat(), c.end_date.isoformat()]
+                for c in PriceCoverage.query.filter(PriceCoverage.ticker.in_(tickers)).all()}
+    matrices = {field: np.full((len(dates), len(tickers)), np.nan, dtype=np.float64) for field in SNAPSHOT_FIELDS}
+    columns = {ticker: i for i, ticker in enumerate(tickers)}
+    for offset in range(0, len(tickers), chunk_size):
+        rows = db.session.query(HistoricalPrice.ticker, HistoricalPrice.date, HistoricalPrice.close,
+                                HistoricalPrice.adj_close).filter(
+            HistoricalPrice.ticker.in_(tickers[offset:offset + chunk_size])).all()
+        if not rows:
+            continue
+        row_tickers, row_dates, close, adj_close = zip(*rows)
+        positions = np.searchsorted(dates, np.array(row_dates, dtype='datetime64[D]'))
+        ticker_positions = np.array([columns[ticker] for ticker in row_tickers])
+        matrices['close'][positions, ticker_positions] = np.array(close, dtype=float)
+        matrices['adj_close'][positions, ticker_positions] = np.array(adj_close, dtype=float)
+
+    index = {
+        'tickers': tickers,
+        'start': str(dates[0]),
+        'end': str(dates[-1]),
+        'built_at': built_at.isoformat(),
+        'coverage': coverage
+    }
+    write_snapshot(snapshot_root(SNAPSHOT_NAME), dict(matrices, dates=dates), index)
+    return index
+
+def load_price_snapshot():
+    """The current price snapshot (see matrix_store.Snapshot), or None if none has been built."""
+    return open_snapshot(snapshot_root(SNAPSHOT_NAME))
+
+def snapshot_frame(tickers=None, start=None, end=None, field='adj_close'):
+    """Date x ticker DataFrame over the memory-mapped snapshot, or None without a snapshot.
+
+    For all tickers the frame is a view of the mapped file (no copy; a
+    date range is a contiguous slice of rows). A ticker subset reads only
+    those columns. Unknown tickers are left out.
+    """
+    snapshot = load_price_snapshot()
+    if snapshot is None:
+        return None
+    dates = snapshot.array('dates')
+    first = np.searchsorted(dates, np.datetime64(start, 'D')) if start is not None else 0
+    last = np.searchsorted(dates, np.datetime64(end, 'D'), side='right') if end is not None else len(dates)
+    matrix = snapshot.array(field)[first:last]
+    universe = snapshot.index['tickers']
+    if tickers is None:
+        columns = universe
+    else:
+        positions = {ticker: i for i, ticker in enumerate(universe)}
+        columns = sorted(ticker for ticker in set(tickers) if ticker in positions)
+        if len(columns) != len(universe):
+            matrix = matrix[:, [positions[ticker] for ticker in columns]]
+    index = pd.DatetimeIndex(dates[first:last].astype('datetime64[ns]'), name='date')
+    return pd.DataFrame(matrix, index=index, columns=pd.Index(columns, name='ticker'), copy=False)
+
+def covered_by_snapshot(tickers, start, end):
+    """Whether the snapshot holds every ticker over [start, end] exactly as the price store does now.
+
+    Besides the snapshot's date range and tickers, each ticker's current
+    PriceCoverage is compared with the one recorded at build time: history
+    backfilled before the recorded start, or bars refreshed at or after the
+    recorded end since the build, make the request fall back to SQL.
+    """
+    snapshot = load_price_snapshot()
+    if snapshot is None:
+        return False
+    index = snapshot.index
+    if snapshot.array('close').dtype != np.float64:
+        # Built by an older version as float32; the next build-price-snapshot replaces it
+        return False
+    tickers = set(tickers)
+    if not (date.fromisoformat(index['start']) <= start and end <= date.fromisoformat(index['end'])
+            and tickers <= set(index['tickers']) and 'built_at' in index):
+        return False
+
+    built_at = datetime.fromisoformat(index['built_at'])
+    recorded = index['coverage']
+    current = {c.ticker: c for c in PriceCoverage.query.filter(PriceCoverage.ticker.in_(tickers)).all()}
+    for ticker in tickers:
+        coverage = current.get(ticker)
+        if ticker not in recorded or coverage is None:
+            if ticker in recorded or coverage is not None:
+                return False
+            continue
+        recorded_start, recorded_end = (date.fromisoformat(day) for day in recorded[ticker])
+        if start < recorded_start and coverage.start_date != recorded_start:
+            return False
+        if end >= recorded_end and (coverage.end_date != recorded_end or coverage.updated_at > built_at):
+            return False
+    return True
+
+@click.command('build-price-snapshot')
+@with_appcontext
+def build_price_snapshot_command():
+    """Write the stored prices as a memory-mapped snapshot for the analytics workers."""
+    index = build_price_snapshot()
+    click.echo(f"Wrote {len(index['tickers'])} tickers from {index['start']} to {index['end']}.")
@@ -0,0 +1,237 @@
+from datetime import date, datetime, timedelta
+import threading
+from flask import current_app
+from sqlalchemy import and_, bindparam
+from app.db_extension import db
+from app.models import HistoricalPrice, PriceCoverage
+from app.price_snapshot import covered_by_snapshot, snapshot_frame
+from app.lazy import lazy_import
+yf = lazy_import('yfinance')
+pd = lazy_import('pandas')
+
+# Earliest date loaded when a caller asks for the full history
+DEFAULT_START_DATE = date(2000, 1, 1)
+
+PRICE_FIELDS = {
+    'close': 'Close',
+    'adj_close': 'Adj Close'
+}
+
+def _to_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.to_datetime(value).date()
+
+def _refresh_seconds():
+    return current_app.config.get('PRICE_REFRESH_SECONDS', 3600)
+
+def _missing_range(coverage, start, end, now):
+    # Return the (start, end) range that still has to be fetched for one ticker, or None
+    if coverage is None:
+        return start, end
+
+    fetch_start = start if start < coverage.start_date else None
+    fetch_end = None
+
+    if end > coverage.end_date:
+        fetch_end = end
+    elif (coverage.updated_at.date() <= coverage.end_date
+          and (now - coverage.updated_at).total_seconds() > _refresh_seconds()):
+        # The last covered day was still trading when it was fetched, so its bar may have changed
+        fetch_end = end
+
+    if fetch_start is not None and fetch_end is not None:
+        return fetch_start, fetch_end
+    if fetch_start is not None:
+        return fetch_start, coverage.start_date - timedelta(days=1)
+    if fetch_end is not None:
+        tail_start = coverage.end_date
+        if coverage.updated_at.date() > coverage.end_date:
+            tail_start = coverage.end_date + timedelta(days=1)
+        return tail_start, fetch_end
+    return None
+
+# yfinance 0.2.x resets module-global result state (shared._DFS) on every yf.download call, so
+# concurrent downloads in one process can drop or swap each other's data
+_download_lock = threading.Lock()
+
+def yf_download(tickers, **kwargs):
+    """yf.download serialized across every thread of the process (requests, job workers, refreshers)."""
+    with _download_lock:
+        return yf.download(tickers, **kwargs)
+
+def download_daily_bars(tickers, start, end):
+    """Download daily bars from yfinance and return them as a long (ticker, date, close, adj_close) frame."""
+    # yfinance treats `end` as exclusive
+    data = yf_download(list(tickers), start=start.strftime('%Y-%m-%d'),
+                       end=(end + timedelta(days=1)).strftime('%Y-%m-%d'),
+                       interval='1d', auto_adjust=False, progress=False, group_by='column')
+    if data is None or data.empty:
+        return pd.DataFrame(columns=['ticker', 'date', 'close', 'adj_close'])
+
+    frames = []
+    for field, column in PRICE_FIELDS.items():
+        if column not in data:
+            continue
+        values = data[column]
+        if isinstance(values, pd.Series):
+            values = values.to_frame(name=tickers[0])
+        values = values.rename_axis(index='date', columns='ticker').reset_index()
+        frames.append(values.melt(id_vars='date', var_name='ticker', value_name=field).set_index(['date', 'ticker']))
+
+    bars = pd.concat(frames, axis=1).reset_index()
+    bars['date'] = pd.to_datetime(bars['date']).dt.date
+    for field in PRICE_FIELDS:
+        if field not in bars:
+            bars[field] = None
+    return bars[['ticker', 'date', 'close', 'adj_close']]
+
+def _store_bars(tickers, start, end, bars, now):
+    # Only tickers that came back with prices are replaced and marked covered; an empty answer
+    # (rate limit, transient error) keeps the stored bars and leaves the range to be fetched again
+    rows = bar_rows(bars)
+    returned = sorted({row['ticker'] for row in rows} & set(tickers))
+    if not returned:
+        return
+
+    # Replace the fetched range in one statement per table so a refreshed bar never duplicates
+    db.session.query(HistoricalPrice).filter(
+        HistoricalPrice.ticker.in_(returned),
+        HistoricalPrice.date >= start,
+        HistoricalPrice.date <= end
+    ).delete(synchronize_session=False)
+    db.session.execute(db.insert(HistoricalPrice), rows)
+    update_coverage(returned, start, end, now)
+
+def bar_rows(bars):
+    """Insert parameters for a long bars frame, skipping bars without any price."""
+    bars = bars.dropna(subset=['close', 'adj_close'], how='all')
+    return [
+        {
+            'ticker': ticker,
+            'date': bar_date,
+            'close': None if pd.isna(close) else float(close),
+            'adj_close': None if pd.isna(adj_close) else float(adj_close)
+        }
+        for ticker, bar_date, close, adj_close in bars.itertuples(index=False)
+    ]
+
+def _replace_rows(model, rows, keys, batch_size=5000):
+    """Portable upsert: delete stored rows with the same `keys`, then insert, in the caller's transaction."""
+    # The last row wins when a key repeats, as with ON CONFLICT DO UPDATE
+    rows = list({tuple(row[key] for key in keys): row for row in rows}.values())
+    table = model.__table__
+    delete = table.delete().where(and_(*(table.c[key] == bindparam(f'key_{key}') for key in keys)))
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        db.session.execute(delete, [{f'key_{key}': row[key] for key in keys} for row in batch])
+        db.session.execute(table.insert(), batch)
+
+def upsert_rows(model, rows, keys, batch_size=5000):
+    """Insert rows into `model`'s table, overwriting stored rows with the same `keys`, in executemany batches."""
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # No ON CONFLICT on this database
+        _replace_rows(model, rows, keys, batch_size)
+        return
+    statement = insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: statement.excluded[column] for column in rows[0] if column not in keys}
+    )
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(statement, rows[offset:offset + batch_size])
+
+def upsert_bars(rows, batch_size=5000):
+    """Insert bars, overwriting stored ones with the same (ticker, date), in executemany batches."""
+    upsert_rows(HistoricalPrice, rows, ['ticker', 'date'], batch_size)
+
+def update_coverage(tickers, start, end, now):
+    """Record that [start, end] has been fetched for the tickers."""
+    coverage_by_ticker = {c.ticker: c for c in PriceCoverage.query.filter(PriceCoverage.ticker.in_(tickers)).all()}
+    for ticker in tickers:
+        coverage = coverage_by_ticker.get(ticker)
+        if coverage is None:
+            db.session.add(PriceCoverage(ticker=ticker, start_date=start, end_date=end, updated_at=now))
+        else:
+            coverage.start_date = min(coverage.start_date, start)
+            if end >= coverage.end_date:
+                coverage.end_date = end
+                coverage.updated_at = now
+
+def missing_ranges(tickers, start, end=None):
+    """{(fetch_start, fetch_end): [tickers]} still to be fetched; tickers missing the same range share a key."""
+    now = datetime.now()
+    start = _to_date(start) or DEFAULT_START_DATE
+    end = min(_to_date(end) or now.date(), now.date())
+    tickers = sorted(set(tickers))
+    if not tickers or start > end:
+        return {}
+
+    coverage_by_ticker = {c.ticker: c for c in PriceCoverage.query.filter(PriceCoverage.ticker.in_(tickers)).all()}
+    pending = {}
+    for ticker in tickers:
+        missing = _missing_range(coverage_by_ticker.get(ticker), start, end, now)
+        if missing is not None:
+            pending.setdefault(missing, []).append(ticker)
+    return pending
+
+def ensure_prices(tickers, start, end=None):
+    """Fetch into the local store only the date ranges that are not stored yet."""
+    now = datetime.now()
+    # Tickers that miss the same range are fetched in one batched download
+    pending = missing_ranges(tickers, start, end)
+
+    try:
+        for (fetch_start, fetch_end), batch in pending.items():
+            bars = download_daily_bars(batch, fetch_start, fetch_end)
+            _store_bars(batch, fetch_start, fetch_end, bars, now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def load_prices(tickers, start, end=None, field='close'):
+    """Read stored bars as a date x ticker DataFrame without touching the network."""
+    start = _to_date(start) or DEFAULT_START_DATE
+    end = _to_date(end) or date.today()
+    if covered_by_snapshot(tickers, start, end):
+        # Served from the shared memory-mapped snapshot instead of the database, copied so callers may modify it
+        prices = snapshot_frame(tickers, start, end, field=field)
+        present = prices.notna()
+        if not present.all(axis=None):
+            prices = prices.loc[present.any(axis=1), present.any(axis=0)]
+        return prices.copy()
+    column = getattr(HistoricalPrice, field)
+    rows = db.session.query(HistoricalPrice.date, HistoricalPrice.ticker, column).filter(
+        HistoricalPrice.ticker.in_(list(tickers)),
+        HistoricalPrice.date >= start,
+        HistoricalPrice.date <= end
+    ).all()
+
+    prices = pd.DataFrame(rows, columns=['date', 'ticker', field])
+    if prices.empty:
+        return pd.DataFrame(columns=sorted(set(tickers)), dtype=float)
+    prices['date'] = pd.to_datetime(prices['date'])
+    return prices.pivot(index='date', columns='ticker', values=field).sort_index()
+
+def latest_price_date(tickers):
+    """Date of the newest stored bar for any of the tickers, or None."""
+    return db.session.query(db.func.max(HistoricalPrice.date)).filter(
+        HistoricalPrice.ticker.in_(list(tickers))
+    ).scalar()
+
+def get_prices(tickers, start, end=None, field='close'):
+    """Read-through access to daily prices: fill gaps from yfinance, then read from the local store."""
+    ensure_prices(tickers, start, end)
+    return load_prices(tickers, start, end, field=field)
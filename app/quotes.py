@@ -0,0 +1,154 @@
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, timedelta
+import threading
+from app.price_store import download_daily_bars
+
+Quote = namedtuple('Quote', ['price', 'fetched_at', 'stale'])
+
+def fetch_last_prices(tickers):
+    # One batched download for all tickers; the last close of the past week is the current price
+    today = date.today()
+    bars = download_daily_bars(list(tickers), today - timedelta(days=7), today)
+    bars = bars.dropna(subset=['close']).sort_values('date')
+    last_prices = bars.groupby('ticker')['close'].last()
+    return {ticker: float(last_prices[ticker]) for ticker in tickers if ticker in last_prices}
+
+class QuoteCache:
+    """Per-process LRU cache of last prices with a TTL.
+
+    Expired entries are still returned (marked stale) while a single
+    background refresher thread re-fetches them in batches, so a page view only blocks on tickers it has
+    never seen before. A ticker that could not be fetched is cached as
+    price None for the shorter failure_ttl_seconds, so a bad or delisted
+    symbol is retried in the background instead of on every page view.
+    """
+
+    def __init__(self, ttl_seconds=300, max_size=1000, fetch=fetch_last_prices, failure_ttl_seconds=60):
+        self.ttl_seconds = ttl_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.max_size = max_size
+        self.fetch = fetch
+        self._entries = OrderedDict()  # ticker -> (price, fetched_at)
+        self._refreshing = set()  # tickers queued for or being refreshed
+        self._queued = []
+        self._refresher = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fetch_errors = 0
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('QUOTE_CACHE_TTL_SECONDS', self.ttl_seconds)
+        self.max_size = app.config.get('QUOTE_CACHE_MAX_SIZE', self.max_size)
+        self.failure_ttl_seconds = app.config.get('QUOTE_CACHE_FAILURE_TTL_SECONDS', self.failure_ttl_seconds)
+
+    def _store(self, prices, fetched_at):
+        with self._lock:
+            for ticker, price in prices.items():
+                previous = self._entries.get(ticker)
+                if price is None and previous is not None and previous[0] is not None:
+                    # A failed refresh keeps the last known price (still shown as stale)
+                    continue
+                self._entries[ticker] = (price, fetched_at)
+                self._entries.move_to_end(ticker)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _fetch(self, tickers):
+        try:
+            prices = self.fetch(tickers)
+        except Exception:
+            with self._lock:
+                self.fetch_errors += 1
+            prices = {}
+        # Tickers without a price are stored as failures so they are not fetched again right away
+        self._store({ticker: prices.get(ticker) for ticker in tickers}, datetime.now())
+        return prices
+
+    def _refresh_loop(self):
+        # One thread per process drains the queue, so page views never start downloads of their own
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                self._wakeup.clear()
+                tickers, self._queued = self._queued, []
+            if not tickers:
+                continue
+            try:
+                self._fetch(tickers)
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(tickers)
+
+    def _schedule_refresh(self, tickers):
+        with self._lock:
+            self._queued.extend(tickers)
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                self._refresher.start()
+        self._wakeup.set()
+
+    def get_quotes(self, tickers):
+        """Return a Quote for every ticker; price is None when it could not be fetched."""
+        now = datetime.now()
+        quotes = {}
+        missing = []
+        expired = []
+
+        with self._lock:
+            for ticker in dict.fromkeys(tickers):
+                entry = self._entries.get(ticker)
+                if entry is None:
+                    self.misses += 1
+                    missing.append(ticker)
+                    continue
+                self._entries.move_to_end(ticker)
+                price, fetched_at = entry
+                ttl_seconds = self.ttl_seconds if price is not None else self.failure_ttl_seconds
+                stale = (now - fetched_at).total_seconds() > ttl_seconds
+                if stale:
+                    self.stale_hits += 1
+                    if ticker not in self._refreshing:
+                        self._refreshing.add(ticker)
+                        expired.append(ticker)
+                else:
+                    self.hits += 1
+                # A failed quote has no old price to mark as stale
+                quotes[ticker] = Quote(price, fetched_at, stale and price is not None)
+
+        if expired:
+            self._schedule_refresh(expired)
+
+        if missing:
+            prices = self._fetch(missing)
+            fetched_at = datetime.now()
+            for ticker in missing:
+                quotes[ticker] = Quote(prices.get(ticker), fetched_at, False)
+
+        return quotes
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'failure_ttl_seconds': self.failure_ttl_seconds,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'fetch_errors': self.fetch_errors,
+                'hit_ratio': round((self.hits + self.stale_hits) / lookups, 4) if lookups else None
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+quote_cache = QuoteCache()
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+import sys
+import threading
+from app.lazy import lazy_import
+pd = lazy_import('pandas')
+
+def estimate_size(value):
+    """Rough size in bytes of a cached value (strings, arrays, frames and containers of them)."""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class ResultCache:
+    """Per-process LRU cache of computed results, bounded by their total size in bytes.
+
+    Keys are (group, version) pairs: storing a newer version of a group
+    drops the older ones, so results computed from yesterday's prices go
+    away as soon as today's are cached.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, config_key=None):
+        self.max_bytes = max_bytes
+        self.config_key = config_key
+        self._entries = OrderedDict()  # (group, version) -> (value, size)
+        self._versions = {}  # group -> version
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        if self.config_key:
+            self.max_bytes = app.config.get(self.config_key, self.max_bytes)
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+        if self._versions.get(key[0]) == key[1]:
+            del self._versions[key[0]]
+
+    def get(self, group, version):
+        with self._lock:
+            entry = self._entries.get((group, version))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((group, version))
+            self.hits += 1
+            return entry[0]
+
+    def latest(self, group):
+        """(version, value) of the entry currently cached for `group`, or None; not counted as a lookup."""
+        with self._lock:
+            version = self._versions.get(group)
+            if version is None:
+                return None
+            return version, self._entries[(group, version)][0]
+
+    def set(self, group, version, value):
+        size = estimate_size(value)
+        with self._lock:
+            previous = self._versions.get(group)
+            if previous is not None:
+                self._remove((group, previous))
+            if size > self.max_bytes:
+                return value
+            self._entries[(group, version)] = (value, size)
+            self._versions[group] = version
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+# Correlation matrices and their ready-to-send Plotly JSON
+correlation_cache = ResultCache(config_key='CORRELATION_CACHE_MAX_BYTES')
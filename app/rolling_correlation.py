@@ -0,0 +1,127 @@
+from collections import deque
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+class RollingCorrelation:
+    """Pearson correlation over a sliding window of daily prices, kept as running sums.
+
+    For every ticker pair the engine stores n, Σx, Σx² and Σxy over the
+    days where both prices are present (the same pairwise handling as
+    DataFrame.corr()). Adding or dropping a day is O(k²) for k tickers, so
+    a window can be moved forward without rescanning its T days.
+    Prices are shifted by each ticker's first price before summing, which
+    keeps the sums small and the variance subtraction accurate.
+    """
+
+    def __init__(self, tickers, window=None):
+        self.tickers = list(tickers)
+        self.window = window  # maximum number of days kept, None for no limit
+        k = len(self.tickers)
+        self._rows = deque()  # (date, prices)
+        self._shift = np.full(k, np.nan)
+        self._n = np.zeros((k, k))
+        self._sx = np.zeros((k, k))  # _sx[i, j]: Σ x_i over days where i and j are both present
+        self._sxx = np.zeros((k, k))
+        self._sxy = np.zeros((k, k))
+
+    @classmethod
+    def from_prices(cls, prices, window=None):
+        engine = cls(prices.columns, window)
+        engine.extend(prices)
+        return engine
+
+    def copy(self):
+        engine = RollingCorrelation(self.tickers, self.window)
+        engine._rows = deque(self._rows)
+        engine._shift = self._shift.copy()
+        engine._n = self._n.copy()
+        engine._sx = self._sx.copy()
+        engine._sxx = self._sxx.copy()
+        engine._sxy = self._sxy.copy()
+        return engine
+
+    @property
+    def nbytes(self):
+        k = len(self.tickers)
+        return (4 * k * k + k * (len(self._rows) + 1)) * 8
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _accumulate(self, block, sign):
+        # block is a (days x tickers) array; matrix products add all of its days at once
+        x = block - self._shift
+        mask = (~np.isnan(x)).astype(float)
+        x = np.nan_to_num(x)
+        self._n += sign * (mask.T @ mask)
+        self._sx += sign * (x.T @ mask)
+        self._sxx += sign * ((x * x).T @ mask)
+        self._sxy += sign * (x.T @ x)
+
+    def _trim(self):
+        if self.window and len(self._rows) > self.window:
+            expired = [self._rows.popleft()[1] for _ in range(len(self._rows) - self.window)]
+            self._accumulate(np.vstack(expired), -1)
+
+    def _append(self, days, block):
+        present = ~np.isnan(block)
+        keep = present.any(axis=1)
+        days = [day for day, kept in zip(days, keep) if kept]
+        block = block[keep]
+        if not days:
+            return
+        # A ticker's shift is fixed by its first price, while its sums are still zero
+        first = np.where(present[keep].any(axis=0), np.argmax(present[keep], axis=0), -1)
+        unset = (first >= 0) & np.isnan(self._shift)
+        self._shift[unset] = block[first[unset], np.flatnonzero(unset)]
+        self._rows.extend(zip(days, block))
+        self._accumulate(block, 1)
+        self._trim()
+
+    def push(self, day, values):
+        """Add one day of prices (ordered like `tickers`); the oldest day drops out past `window`."""
+        self._append([day], np.asarray(values, dtype=float).reshape(1, -1))
+
+    def extend(self, prices):
+        """Add every row of a date-sorted date x ticker frame; missing tickers count as missing prices."""
+        prices = prices.reindex(columns=self.tickers)
+        self._append(list(prices.index), prices.to_numpy(dtype=float))
+
+    def expire(self, start):
+        """Drop days before `start`."""
+        expired = []
+        while self._rows and self._rows[0][0] < start:
+            expired.append(self._rows.popleft()[1])
+        if expired:
+            self._accumulate(np.vstack(expired), -1)
+
+    def pop_since(self, day):
+        """Drop days from `day` on, e.g. before re-adding a bar that was refreshed."""
+        dropped = []
+        while self._rows and self._rows[-1][0] >= day:
+            dropped.append(self._rows.pop()[1])
+        if dropped:
+            self._accumulate(np.vstack(dropped), -1)
+
+    def prices(self):
+        """The days in the window as a date x ticker frame."""
+        if not self._rows:
+            return pd.DataFrame(columns=self.tickers, dtype=float)
+        days, values = zip(*self._rows)
+        return pd.DataFrame(np.vstack(values), index=pd.DatetimeIndex(days), columns=self.tickers)
+
+    def observations(self):
+        """Number of days with a price, per ticker."""
+        return pd.Series(np.diag(self._n).astype(int), index=self.tickers)
+
+    def matrix(self, min_periods=1):
+        """Pairwise Pearson correlation of the current window as a DataFrame."""
+        n = self._n
+        covariance = n * self._sxy - self._sx * self._sx.T
+        variance = n * self._sxx - self._sx * self._sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = covariance / np.sqrt(variance * variance.T)
+        correlation[(n < max(min_periods, 2)) | (variance <= 0) | (variance.T <= 0)] = np.nan
+        np.clip(correlation, -1, 1, out=correlation)
+        return pd.DataFrame(correlation, index=self.tickers, columns=self.tickers)
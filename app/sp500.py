@@ -0,0 +1,91 @@
+from datetime import date, datetime
+import time
+import click
+from flask.cli import with_appcontext
+from app.db_extension import db
+from app.models import SP500Ticker, SP500MembershipChange
+from app.lazy import lazy_import
+pd = lazy_import('pandas')
+
+# Page with the list of S&P 500 companies; its first table holds the constituents
+SP500_SOURCE_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+
+def sp500_symbols():
+    # Yahoo uses '-' where Wikipedia uses '.' (BRK.B -> BRK-B)
+    return [row.ticker.replace('.', '-') for row in SP500Ticker.query.order_by(SP500Ticker.ticker).all()]
+
+def read_constituents(source=None):
+    """{ticker: company name} from the Wikipedia page, a saved copy of it, or a CSV with Symbol and Security columns."""
+    source = source or SP500_SOURCE_URL
+    if str(source).lower().endswith('.csv'):
+        table = pd.read_csv(source)
+    else:
+        table = pd.read_html(source)[0]
+    table = table[['Symbol', 'Security']].dropna()
+    return {str(ticker).strip(): str(name).strip() for ticker, name in table.itertuples(index=False)}
+
+def diff_constituents(existing, incoming):
+    """Compare {ticker: (id, name)} rows with {ticker: name}; returns (inserts, updates, removals)."""
+    inserts = [{'ticker': ticker, 'company_name': name} for ticker, name in incoming.items() if ticker not in existing]
+    updates = [{'id': existing[ticker][0], 'company_name': name} for ticker, name in incoming.items()
+               if ticker in existing and existing[ticker][1] != name]
+    removals = [ticker for ticker in existing if ticker not in incoming]
+    return inserts, updates, removals
+
+def refresh_sp500(source=None, effective_date=None):
+    """Bring SP500Ticker in line with the current constituent list in one transaction.
+
+    Only the difference is written: one bulk INSERT, one bulk UPDATE by
+    primary key and one DELETE. Joins and departures are recorded in
+    sp500_membership_changes, except on the very first load.
+    """
+    started = time.perf_counter()
+    incoming = read_constituents(source)
+    if not incoming:
+        raise ValueError('The S&P 500 source contains no constituents.')
+    fetched = time.perf_counter()
+
+    effective_date = effective_date or date.today()
+    existing = {ticker: (row_id, name) for row_id, ticker, name in
+                db.session.query(SP500Ticker.id, SP500Ticker.ticker, SP500Ticker.company_name)}
+    inserts, updates, removals = diff_constituents(existing, incoming)
+
+    try:
+        if removals:
+            SP500Ticker.query.filter(SP500Ticker.ticker.in_(removals)).delete(synchronize_session=False)
+        if inserts:
+            db.session.execute(db.insert(SP500Ticker), inserts)
+        if updates:
+            db.session.execute(db.update(SP500Ticker), updates)
+        if existing:
+            now = datetime.now()
+            changes = [{'ticker': row['ticker'], 'company_name': row['company_name'], 'change': 'added',
+                        'effective_date': effective_date, 'recorded_at': now} for row in inserts]
+            changes += [{'ticker': ticker, 'company_name': existing[ticker][1], 'change': 'removed',
+                         'effective_date': effective_date, 'recorded_at': now} for ticker in removals]
+            if changes:
+                db.session.execute(db.insert(SP500MembershipChange), changes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'constituents': len(incoming),
+        'added': len(inserts),
+        'updated': len(updates),
+        'removed': len(removals),
+        'fetch_seconds': round(fetched - started, 3),
+        'write_seconds': round(time.perf_counter() - fetched, 3)
+    }
+
+@click.command('update-sp500')
+@with_appcontext
+@click.option('--source', default=None, help='Local HTML or CSV file to read instead of Wikipedia (e.g. for offline runs).')
+@click.option('--effective-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Date recorded for membership changes (default today).')
+def update_sp500_command(source, effective_date):
+    """Refresh the S&P 500 constituent list."""
+    summary = refresh_sp500(source, effective_date.date() if effective_date else None)
+    click.echo(f"{summary['constituents']} constituents: {summary['added']} added, {summary['updated']} renamed, "
+               f"{summary['removed']} removed (read {summary['fetch_seconds']} s, write {summary['write_seconds']} s).")
@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+import click
+from flask.cli import with_appcontext
+from app.matrix_store import open_snapshot, snapshot_root, write_snapshot
+from app.price_store import get_prices
+from app.sp500 import sp500_symbols
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+
+# Windows in trading days of daily returns
+CORRELATION_WINDOWS = {
+    '1y': 252,
+    '3y': 756,
+    '5y': 1260,
+    '10y': 2520
+}
+
+# Pairs with fewer common return days than this get NaN
+MIN_OVERLAP = 20
+
+SNAPSHOT_NAME = 'sp500_correlation'
+
+def return_correlation(returns):
+    """Correlation of a (days x tickers) float32 return matrix with NaN for missing days.
+
+    Each ticker is standardized over its own days, missing days are zeroed
+    and masked, and the matrix is one float32 product normalised by the
+    squared norms over each pair's common days.
+    """
+    mask = ~np.isnan(returns)
+    counts = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(returns, axis=0) / counts
+        std = np.sqrt(np.nansum((returns - mean) ** 2, axis=0) / counts)
+        z = np.where(mask, (returns - mean) / std, 0).astype(np.float32)
+    z[:, ~np.isfinite(std) | (std == 0)] = 0
+    maskf = mask.astype(np.float32)
+    squares = (z * z).T @ maskf  # squares[i, j]: Σ z_i² over the days i and j share
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = (z.T @ z) / np.sqrt(squares * squares.T)
+    correlation[(maskf.T @ maskf) < MIN_OVERLAP] = np.nan
+    np.clip(correlation, -1, 1, out=correlation)
+    return correlation.astype(np.float32)
+
+def build_sp500_correlation(end=None):
+    """Compute the constituent return-correlation matrices for every window and write them as a snapshot."""
+    end = end or date.today()
+    tickers = sorted(sp500_symbols())
+    if not tickers:
+        raise click.ClickException('The S&P 500 ticker list is empty; update it from the admin page first.')
+
+    longest = max(CORRELATION_WINDOWS.values())
+    # Calendar days with room for holidays, plus one day for the first return
+    prices = get_prices(tickers, end - timedelta(days=int(longest * 1.5) + 10), end, field='adj_close')
+    prices = prices.reindex(columns=tickers).dropna(how='all')
+    returns = prices.pct_change(fill_method=None).iloc[1:].to_numpy(dtype=np.float32)
+
+    arrays = {period: return_correlation(returns[-window:]) for period, window in CORRELATION_WINDOWS.items()}
+    index = {
+        'tickers': tickers,
+        'as_of': prices.index[-1].strftime('%Y-%m-%d') if len(prices) else None,
+        'days': {period: int(min(window, len(returns))) for period, window in CORRELATION_WINDOWS.items()}
+    }
+    write_snapshot(snapshot_root(SNAPSHOT_NAME), arrays, index)
+    return index
+
+def load_sp500_correlation(period, tickers=None):
+    """(tickers, matrix, index) for a window, with the matrix memory-mapped; None if no snapshot exists.
+
+    Without `tickers` the full matrix is returned as a read-only view of the
+    mapped file. With a subset only the requested rows are read; unknown
+    tickers are skipped; Wikipedia spellings like BRK.B match the stored
+    Yahoo symbol BRK-B.
+    """
+    snapshot = open_snapshot(snapshot_root(SNAPSHOT_NAME))
+    if snapshot is None:
+        return None
+    matrix = snapshot.array(period)
+    universe = snapshot.index['tickers']
+    if tickers is None:
+        return universe, matrix, snapshot.index
+
+    positions = {ticker: i for i, ticker in enumerate(universe)}
+    selected = [ticker for ticker in dict.fromkeys(ticker.replace('.', '-') for ticker in tickers) if ticker in positions]
+    rows = [positions[ticker] for ticker in selected]
+    return selected, matrix[np.ix_(rows, rows)], snapshot.index
+
+@click.command('build-sp500-correlation')
+@with_appcontext
+def build_sp500_correlation_command():
+    """Refresh S&P 500 prices and rebuild the correlation matrix snapshot."""
+    index = build_sp500_correlation()
+    click.echo(f"Wrote correlation matrices for {len(index['tickers'])} tickers as of {index['as_of']}.")
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from datetime import date
+from app.fx import convert
+from app.lots import TaxLotIndex, trades_from_transactions
+from app.models import Transaction
+from app.lazy import lazy_import
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Czech income tax on the sale of securities: a lot held for more than three years is exempt (time test),
+# and so is the whole year when the gross proceeds of all other sales stay within the limit
+TIME_TEST_YEARS = 3
+TAX_FREE_PROCEEDS_CZK = 100000
+TAX_CURRENCY = 'CZK'
+
+REPORT_COLUMNS = ['portfolio_id', 'ticker', 'buy_date', 'sell_date', 'quantity', 'buy_price', 'sell_price',
+                  'buy_fees', 'sell_fees', 'currency', 'proceeds', 'cost', 'profit', 'time_test']
+
+def tax_lot_indexes(portfolio_ids):
+    """{(portfolio_id, ticker): TaxLotIndex} for the portfolios' transactions."""
+    grouped = defaultdict(list)
+    for transaction in Transaction.query.filter(Transaction.portfolio_id.in_(portfolio_ids)).all():
+        grouped[(transaction.portfolio_id, transaction.stock_ticker)].append(transaction)
+    return {key: TaxLotIndex(trades_from_transactions(transactions)) for key, transactions in grouped.items()}
+
+def tax_free_quantities(indexes, as_of=None):
+    """{ticker: open quantity that already passed the time test on `as_of`} summed over portfolios."""
+    as_of = as_of or date.today()
+    quantities = defaultdict(float)
+    for (_, ticker), index in indexes.items():
+        quantities[ticker] += index.tax_free_quantity(as_of, TIME_TEST_YEARS)
+    return dict(quantities)
+
+def _year_matches(key, index, year):
+    # FIFO matches of one lot index whose sell falls into `year`, as report columns in the trade currency
+    buy_positions, sell_positions, quantities = index.matches()
+    sell_dates = index.sell_dates[sell_positions]
+    in_year = (sell_dates >= np.datetime64(f'{year}-01-01')) & (sell_dates <= np.datetime64(f'{year}-12-31'))
+    if not in_year.any():
+        return None
+    buy_positions, sell_positions, quantities = buy_positions[in_year], sell_positions[in_year], quantities[in_year]
+
+    buys, sells = index.buys, index.sells
+    buy_quantity = np.array([t.quantity for t in buys])[buy_positions]
+    sell_quantity = np.array([t.quantity for t in sells])[sell_positions]
+    # Fees of partially matched trades are split by quantity
+    buy_fees = quantities * np.array([t.cost for t in buys])[buy_positions] / buy_quantity
+    sell_fees = quantities * np.array([t.cost for t in sells])[sell_positions] / sell_quantity
+    return pd.DataFrame({
+        'portfolio_id': key[0],
+        'ticker': key[1],
+        'buy_date': index.buy_dates[buy_positions],
+        'sell_date': sell_dates[in_year],
+        'quantity': quantities,
+        'buy_price': np.array([t.price for t in buys])[buy_positions],
+        'sell_price': np.array([t.price for t in sells])[sell_positions],
+        'buy_fees': buy_fees,
+        'sell_fees': sell_fees,
+        'currency': np.array([t.currency for t in buys], dtype=object)[buy_positions]
+    })
+
+def tax_report(portfolio_ids, year):
+    """FIFO-matched sales of `year` with the Czech time test, in CZK, plus a summary.
+
+    Proceeds and sell fees are converted at the rate of the sell date,
+    purchase price and buy fees at the rate of the buy date (daily rates,
+    one convert() call).
+    Lots held for more than TIME_TEST_YEARS years are exempt; if the gross
+    proceeds of the remaining sales stay within TAX_FREE_PROCEEDS_CZK the
+    whole year is. A loss only offsets gains of the same year.
+    """
+    frames = []
+    for key, index in tax_lot_indexes(portfolio_ids).items():
+        frame = _year_matches(key, index, year)
+        if frame is not None:
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=REPORT_COLUMNS), None
+    report = pd.concat(frames, ignore_index=True).sort_values(['sell_date', 'ticker', 'buy_date'], ignore_index=True)
+
+    buy_dates = pd.DatetimeIndex(report['buy_date'])
+    sell_dates = pd.DatetimeIndex(report['sell_date'])
+    count = len(report)
+    converted = convert(
+        np.concatenate([report['quantity'] * report['sell_price'],
+                        report['quantity'] * report['buy_price'] + report['buy_fees'],
+                        report['sell_fees']]),
+        np.concatenate([report['currency']] * 3),
+        sell_dates.append(buy_dates).append(sell_dates),
+        TAX_CURRENCY
+    )
+    report['proceeds'] = converted[:count]
+    report['cost'] = converted[count:2 * count] + converted[2 * count:]
+    report['profit'] = report['proceeds'] - report['cost']
+    report['time_test'] = buy_dates < sell_dates - pd.DateOffset(years=TIME_TEST_YEARS)
+
+    taxable = report[~report['time_test']]
+    proceeds = float(taxable['proceeds'].sum())
+    small_sales = proceeds <= TAX_FREE_PROCEEDS_CZK
+    profit = float(taxable['profit'].sum())
+    summary = {
+        'year': year,
+        'currency': TAX_CURRENCY,
+        'proceeds': proceeds,
+        'cost': float(taxable['cost'].sum()),
+        'profit': profit,
+        'exempt_proceeds': float(report.loc[report['time_test'], 'proceeds'].sum()),
+        'exempt_profit': float(report.loc[report['time_test'], 'profit'].sum()),
+        'small_sales_exempt': small_sales,
+        'tax_base': 0.0 if small_sales else max(profit, 0.0)
+    }
+    return report, summary
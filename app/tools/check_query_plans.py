@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy.dialects import sqlite
+
+# Check that the hot Transaction queries are answered from the composite indexes.
+# Runs against a throwaway in-memory SQLite database: python app/tools/check_query_plans.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import create_app
+from app.db_extension import db
+from app.models import Transaction, User, Portfolio
+from app.blueprints.correlation import traded_tickers_query
+
+def explain(query):
+    statement = query.statement.compile(dialect=sqlite.dialect(), compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')).fetchall()
+    return [row[-1] for row in rows]
+
+def seed(users=20, rows_per_user=200):
+    # Several users so that per-user filters are selective, as in a real database
+    owners = []
+    for n in range(users):
+        user = User(username=f'plan-check-{n}', password='-', status='active')
+        db.session.add(user)
+        db.session.flush()
+        portfolio = Portfolio(name='plan-check', user_id=user.id)
+        db.session.add(portfolio)
+        db.session.flush()
+        owners.append((user, portfolio))
+
+    start = date(2015, 1, 1)
+    db.session.execute(db.insert(Transaction), [
+        {'user_id': user.id, 'portfolio_id': portfolio.id, 'date': start + timedelta(days=i),
+         'stock_ticker': f'T{i % 20}', 'stock_price': 10.0, 'transaction_type': 'buy', 'transaction_cost': 1.0,
+         'stock_quantity': 1.0, 'total_transaction_cost': 11.0, 'currency': 'USD'}
+        for user, portfolio in owners for i in range(rows_per_user)
+    ])
+    db.session.execute(db.text('ANALYZE'))
+    return owners[0]
+
+def main():
+    app = create_app()
+    with app.app_context():
+        user, portfolio = seed()
+        checks = {
+            'ix_transaction_portfolio_date': [
+                traded_tickers_query([portfolio.id], datetime.now() - timedelta(days=365)),
+            ],
+            'ix_transaction_user_ticker_date': [
+                Transaction.query.filter_by(user_id=user.id),
+                Transaction.query.filter(Transaction.user_id == user.id, Transaction.stock_ticker == 'T1',
+                                         Transaction.date >= date(2016, 1, 1)),
+            ],
+        }
+        failed = False
+        for index_name, queries in checks.items():
+            for query in queries:
+                plan = explain(query)
+                used = any(index_name in step for step in plan)
+                failed = failed or not used
+                print(f"{'ok  ' if used else 'FAIL'} {index_name}: {' | '.join(plan)}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
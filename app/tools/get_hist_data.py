@@ -1,52 +1,17 @@
-import yfinance as yf
-import pandas as pd
-import sqlite3
+import os
+import sys
 
-# List of S&P 500 tickers (for demonstration purposes, a few tickers are used)
-# Load the tickers from the SP500 database
-conn = sqlite3.connect('sp500.db')
-cursor = conn.cursor()
+# Allow running as `python app/tools/get_hist_data.py` from anywhere
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-# Retrieve the tickers from the database
-cursor.execute('SELECT DISTINCT ticker FROM sp500_tickers')
-sp500_tickers = [row[0] for row in cursor.fetchall()]
+from app import create_app
+from app.price_ingest import ingest_prices
+from app.sp500 import sp500_symbols
 
-# Close the connection
-conn.close()
-print(sp500_tickers)
-# Define the date range
-start_date = '2000-01-01'
-end_date = '2024-09-01'
+# Backfill daily bars for all S&P 500 constituents into the app's price store.
+# Same as `flask ingest-prices`; re-running only fetches what is missing.
+app = create_app()
+with app.app_context():
+    summary = ingest_prices(sp500_symbols(), progress=print)
 
-# Connect to the SQLite database (or create it if it doesn't exist)
-conn = sqlite3.connect('sp500_historical_data.db')
-cursor = conn.cursor()
-
-# Create the table for storing historical data if it doesn't exist
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS historical_prices (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ticker TEXT NOT NULL,
-        date TEXT NOT NULL,
-        close REAL NOT NULL
-    )
-''')
-
-# Download historical data for each ticker
-for ticker in sp500_tickers:
-    print(f"Downloading data for {ticker}...")
-    data = yf.download(ticker, start=start_date, end=end_date, interval='1wk')
-    data.reset_index(inplace=True)
-    
-    # Insert data into the database
-    for index, row in data.iterrows():
-        cursor.execute('''
-            INSERT INTO historical_prices (ticker, date, close)
-            VALUES (?, ?, ?)
-        ''', (ticker, row['Date'].strftime('%Y-%m-%d'), row['Close']))
-
-# Commit the transaction and close the connection
-conn.commit()
-conn.close()
-
-print("Historical data has been successfully downloaded and stored in the database.")
\ No newline at end of file
+print(f"Stored {summary['rows']} rows in {summary['seconds']} s ({summary['rows_per_second']} rows/s).")
@@ -1,17 +1,19 @@
-from flask import Flask
-from flask_migrate import Migrate
-from db_extension import db
-from models import User, Transaction, SP500Ticker, Portfolio
 import os
+import sys
+from flask.cli import FlaskGroup
+from flask_migrate import Migrate
+
+# Allow running as `python app/tools/manage.py db upgrade` from anywhere
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import create_app
+from app.db_extension import db
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app = create_app()
+# Batch mode lets column type changes run on SQLite, which has no ALTER COLUMN
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(__file__), '..', 'migrations'), render_as_batch=True)
 
-db.init_app(app)
-migrate = Migrate(app, db)
+cli = FlaskGroup(create_app=lambda: app)
 
 if __name__ == '__main__':
-    from flask.cli import main
-    main()
\ No newline at end of file
+    cli()
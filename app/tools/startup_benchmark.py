@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+
+# Measure what a fresh worker pays before its first request: import time and resident memory.
+# Every measurement runs in its own interpreter so nothing is already imported:
+#   python app/tools/startup_benchmark.py            create_app() plus the app's modules
+#   python app/tools/startup_benchmark.py pandas dash  any modules
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Libraries that should only be imported by the routes that use them
+HEAVY_MODULES = ['pandas', 'numpy', 'yfinance', 'plotly', 'plotly.express', 'dash', 'xlsxwriter']
+
+APP_MODULES = [
+    'app.blueprints.auth', 'app.blueprints.main', 'app.blueprints.correlation', 'app.blueprints.transactions',
+    'app.blueprints.dca', 'app.blueprints.dca_stocks', 'app.blueprints.admin', 'app.blueprints.jobs',
+    'app.price_store', 'app.dash_app'
+]
+
+MEASURE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+before = rss_kb()
+started = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'rss_kb': rss_kb(), 'rss_delta_kb': rss_kb() - before,
+                  'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def measure(statement):
+    env = dict(os.environ, DATABASE_URL=os.environ.get('DATABASE_URL', 'sqlite://'),
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'startup-benchmark'))
+    code = MEASURE.format(root=ROOT, statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def row(name, result):
+    heavy = ', '.join(result['heavy']) or '-'
+    return f"{name:<32} {result['seconds'] * 1000:>8.0f} ms {result['rss_delta_kb'] / 1024:>8.1f} MB   {heavy}"
+
+def main(modules):
+    print(f"{'':<32} {'import':>11} {'RSS +':>11}   heavy libraries loaded")
+    if not modules:
+        print(row('create_app()', measure('from app import create_app\ncreate_app()')))
+        modules = APP_MODULES + HEAVY_MODULES
+    for module in modules:
+        print(row(module, measure(f'import {module}')))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,8 +1,7 @@
 from datetime import datetime, timedelta
-from flask import session
-from app.models import User
 from datetime import timedelta
-import numpy as np
+from app.lazy import lazy_import
+np = lazy_import('numpy')
 
 def get_time_delta(period):
     if period == '1y':
@@ -25,16 +24,6 @@ def calculate_average_correlation(correlation_matrix):
         return 0
     return np.mean(valid_correlations)
 
-def is_admin():
-    if 'user' in session:
-        user = User.query.filter_by(username=session['user']).first()
-        return user and user.is_admin == 1
-    return False
-
-def user_is_admin(username):
-    user = User.query.filter_by(username=username).first()
-    return user and user.is_admin == 1
-
 def get_time_delta(period):
     if period == '1y':
         return timedelta(days=365)
@@ -7,4 +7,29 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     ENV = os.getenv('FLASK_ENV', 'production')
+    # How long today's stored bars are trusted before the price store refreshes them
+    PRICE_REFRESH_SECONDS = int(os.getenv('PRICE_REFRESH_SECONDS', 3600))
+    # Last-price cache used by the transactions page
+    QUOTE_CACHE_TTL_SECONDS = int(os.getenv('QUOTE_CACHE_TTL_SECONDS', 300))
+    QUOTE_CACHE_MAX_SIZE = int(os.getenv('QUOTE_CACHE_MAX_SIZE', 1000))
+    # Tickers that could not be fetched are retried after this many seconds
+    QUOTE_CACHE_FAILURE_TTL_SECONDS = int(os.getenv('QUOTE_CACHE_FAILURE_TTL_SECONDS', 60))
+    # Process pool size for Monte Carlo DCA runs, per web worker (defaults to min(4, CPU count))
+    MONTE_CARLO_WORKERS = int(os.getenv('MONTE_CARLO_WORKERS', 0)) or None
+    # How long a worker trusts its cached copy of a user's role and status
+    USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+    # Memory budget for cached correlation matrices and charts, per worker
+    CORRELATION_CACHE_MAX_BYTES = int(os.getenv('CORRELATION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Memory-mapped snapshots shared by all workers (defaults to <instance folder>/snapshots)
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR')
+    # 'compact' downsamples chart lines to CHART_MAX_POINTS and sends them as binary arrays; 'full' sends every point
+    CHART_PAYLOAD_MODE = os.getenv('CHART_PAYLOAD_MODE', 'compact')
+    CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 1500))
+    # Background jobs: worker threads per web process (0 when `flask run-jobs` runs as a sidecar),
+    # per-job timeout and how long finished results are kept
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    JOB_TIMEOUT_SECONDS = int(os.getenv('JOB_TIMEOUT_SECONDS', 120))
+    JOB_RESULT_TTL_SECONDS = int(os.getenv('JOB_RESULT_TTL_SECONDS', 3600))
+    # Currencies offered as reporting currency; rates are cached in the price store as <CUR>USD=X
+    FX_CURRENCIES = os.getenv('FX_CURRENCIES', 'USD,EUR,CZK').split(',')
     DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() in ['true', '1', 't']
\ No newline at end of file